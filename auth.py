@@ -1,28 +1,116 @@
 # Auth
 import os
 import uuid
+import asyncio
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from bd import users_coll, sessions_coll
+from revocacion import lista_revocacion
 from dotenv import load_dotenv
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# "sesion": cada petición consulta la colección de sesiones (por defecto)
+# "jwt": solo se verifica la firma y la lista de revocación en memoria
+AUTH_MODO = os.getenv("AUTH_MODO", "sesion").lower()
+# Exigir token en los endpoints de análisis de imágenes
+AUTH_FILTROS = os.getenv("AUTH_FILTROS", "").lower() in ("1", "true", "si")
+# Caché de sesiones validadas: evita ir a Mongo en cada petición autenticada
+SESION_CACHE_TAMANO = int(os.getenv("SESION_CACHE_TAMANO", "1024"))
+# La caché es local a cada proceso: un logout o cambio de contraseña hecho en
+# otro worker no la invalida. Por eso con WEB_CONCURRENCY > 1 viene apagada
+# (TTL 0) salvo que se fije SESION_CACHE_TTL aceptando ese retraso
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SESION_CACHE_TTL = int(os.getenv("SESION_CACHE_TTL", "60" if WEB_CONCURRENCY <= 1 else "0"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Factor de trabajo de bcrypt; al cambiarlo, los hashes se actualizan en el siguiente login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hilos dedicados a bcrypt (libera el GIL); acotan cuántos hashes corren a la vez
+HASH_HILOS = int(os.getenv("HASH_HILOS", "2"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+_pool_hash = ThreadPoolExecutor(max_workers=HASH_HILOS, thread_name_prefix="bcrypt")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+class CacheSesiones:
+    """
+    LRU con caducidad: token validado -> documento del usuario.
+    Las entradas nunca viven más que el `exp` del JWT y se invalidan
+    explícitamente al revocar tokens o cambiar la contraseña, pero solo en
+    este proceso: pensada para un único worker (ver SESION_CACHE_TTL).
+    """
+
+    def __init__(self, tamano: int = SESION_CACHE_TAMANO, ttl: int = SESION_CACHE_TTL):
+        self.tamano = tamano
+        self.ttl = ttl
+        self._datos: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            entrada = self._datos.get(token)
+            if entrada is None:
+                return None
+            expira, usuario = entrada
+            if expira < time.monotonic():
+                del self._datos[token]
+                return None
+            self._datos.move_to_end(token)
+            return usuario
+
+    def guardar(self, token: str, usuario: Dict, exp: Optional[float] = None):
+        if self.tamano <= 0 or self.ttl <= 0:
+            return
+        vigencia = self.ttl
+        if exp is not None:
+            vigencia = min(vigencia, exp - time.time())
+        if vigencia <= 0:
+            return
+        with self._lock:
+            self._datos[token] = (time.monotonic() + vigencia, usuario)
+            self._datos.move_to_end(token)
+            while len(self._datos) > self.tamano:
+                self._datos.popitem(last=False)
+
+    def invalidar_token(self, token: str):
+        with self._lock:
+            self._datos.pop(token, None)
+
+    def invalidar_usuario(self, user_id: Optional[str] = None, email: Optional[str] = None):
+        """Elimina todas las sesiones cacheadas de un usuario (por id o email)"""
+        with self._lock:
+            for token in [
+                t for t, (_, u) in self._datos.items()
+                if (user_id is not None and str(u.get("_id")) == str(user_id))
+                or (email is not None and u.get("email") == email)
+            ]:
+                del self._datos[token]
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+cache_sesiones = CacheSesiones()
+
 #Tokens
-async def save_token(user_id, token):
-    session_id = str(uuid.uuid4())
+async def save_token(user_id, token, session_id: Optional[str] = None):
+    session_id = session_id or str(uuid.uuid4())
     await sessions_coll.insert_one({
         "user_id": user_id,
         "token": token,
@@ -33,9 +121,22 @@ async def save_token(user_id, token):
 
 async def revoke_token(token):
     await sessions_coll.delete_one({"token": token})
+    cache_sesiones.invalidar_token(token)
+    # En modo sesión basta con borrar la sesión: la lista de revocación solo se lee en modo JWT
+    if AUTH_MODO != "jwt":
+        return
+    try:
+        claims = jwt.get_unverified_claims(token)
+    except JWTError:
+        return
+    if claims.get("jti") and claims.get("exp"):
+        await lista_revocacion.revocar_token(claims["jti"], claims["exp"])
     
 async def revoke_all_tokens(user_id):
     await sessions_coll.delete_many({"user_id": user_id})
+    cache_sesiones.invalidar_usuario(user_id=user_id)
+    if AUTH_MODO == "jwt":
+        await lista_revocacion.revocar_usuario(user_id, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 async def is_token_valid(token):
     session = await sessions_coll.find_one({"token": token})
@@ -44,23 +145,20 @@ async def is_token_valid(token):
 #reseteo de contraseña
 async def create_password_reset_token(email: str) -> Optional[str]:
     """Crea un token de reseteo de contraseña con caducidad de 1 hora."""
-    # Verificar que el usuario existe
-    user = await users_coll.find_one({"email": email})
-    if not user:
-        # No indicamos si el usuario existe o no por seguridad
-        return None
-        
     # Generar token seguro aleatorio
     reset_token = secrets.token_urlsafe(32)
     
-    # Guardar el token en la base de datos
-    await users_coll.update_one(
+    # Guardar el token en la base de datos; el update confirma además que el usuario existe
+    res = await users_coll.update_one(
         {"email": email},
         {"$set": {
             "reset_token": reset_token,
             "reset_token_expires": datetime.utcnow() + timedelta(hours=1)
         }}
     )
+    if res.matched_count == 0:
+        # No indicamos si el usuario existe o no por seguridad
+        return None
     
     return reset_token
 
@@ -83,7 +181,7 @@ async def reset_password(token: str, new_password: str) -> bool:
         return False
         
     # Hash de la nueva contraseña
-    hashed_pw = get_password_hash(new_password)
+    hashed_pw = await get_password_hash_async(new_password)
     
     # Actualizar contraseña y eliminar el token de reseteo
     await users_coll.update_one(
@@ -93,39 +191,104 @@ async def reset_password(token: str, new_password: str) -> bool:
             "$unset": {"reset_token": "", "reset_token_expires": ""}
         }
     )
+    cache_sesiones.invalidar_usuario(email=email)
     
     return True
 
 #Funciones
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def find_user_by_login(identificador: str) -> Optional[Dict]:
+    """
+    Busca por email o username en una sola consulta; si ambos coinciden
+    con usuarios distintos, gana el email (como antes)
+    """
+    user = None
+    async for candidato in users_coll.find(
+        {"$or": [{"email": identificador}, {"username": identificador}]}
+    ).limit(2):
+        if candidato.get("email") == identificador:
+            return candidato
+        user = candidato
+    return user
 
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+# bcrypt tarda ~250 ms: siempre en el pool dedicado, nunca en el event loop
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool_hash, pwd_context.hash, password)
 
-def create_access_token(sub: str, expires_delta: Optional[timedelta] = None) -> str:
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool_hash, pwd_context.verify, plain, hashed)
+
+async def verify_and_update_password(plain: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña y, si el hash usa una configuración antigua
+    (p. ej. otro BCRYPT_ROUNDS), devuelve también el hash nuevo a guardar
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool_hash, pwd_context.verify_and_update, plain, hashed)
+
+def cerrar_pool_hash():
+    _pool_hash.shutdown(wait=False, cancel_futures=True)
+
+def create_access_token(
+    sub: str,
+    expires_delta: Optional[timedelta] = None,
+    jti: Optional[str] = None,
+    user_id: Optional[str] = None
+) -> str:
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode = {"exp": expire, "sub": sub}
+    # iat con milisegundos: /logout-all invalida los tokens emitidos antes de ese instante
+    to_encode = {"exp": expire, "sub": sub, "iat": round(time.time(), 3)}
+    if jti:
+        to_encode["jti"] = jti
+    if user_id:
+        to_encode["uid"] = user_id
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
+def _credenciales_invalidas() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail={"error_code": "UNAUTHORIZED", "message": "Credenciales inválidas"},
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def validate_token(token: str) -> Dict:
+    """
+    Devuelve los claims si el token sigue vigente. En modo "jwt" los tokens
+    con jti se validan sin ir a Mongo; el resto consulta la sesión.
+    """
     try:
-        if not await is_token_valid(token):
-            raise credentials_exception
-            
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        raise _credenciales_invalidas()
+    if payload.get("sub") is None:
+        raise _credenciales_invalidas()
+
+    if AUTH_MODO == "jwt" and payload.get("jti"):
+        if lista_revocacion.esta_revocado(payload["jti"], payload.get("uid"), payload.get("iat")):
+            raise _credenciales_invalidas()
+    elif not await is_token_valid(token):
+        raise _credenciales_invalidas()
+    return payload
+
+async def get_token_claims(token: str = Depends(oauth2_scheme)) -> Dict:
+    """Dependencia liviana: exige un token válido sin cargar el usuario"""
+    return await validate_token(token)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    # En modo sesión un acierto de caché ya implica una sesión validada en Mongo;
+    # en modo JWT la firma y la lista de revocación se comprueban siempre (sin BD)
+    payload = await validate_token(token) if AUTH_MODO == "jwt" else None
+
+    user = cache_sesiones.obtener(token)
+    if user is not None:
+        return user
+
+    if payload is None:
+        payload = await validate_token(token)
 
-    user = await users_coll.find_one({"email": email})
+    user = await users_coll.find_one({"email": payload["sub"]})
     if not user:
-        raise credentials_exception
+        raise _credenciales_invalidas()
+    cache_sesiones.guardar(token, user, payload.get("exp"))
     return user
\ No newline at end of file
@@ -1,17 +1,107 @@
 # BD
 import os
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
 from pymongo.server_api import ServerApi
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from filtros.metricas import MonitorMongo
 
-load_dotenv() 
+load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "testdb")
+# Pool de conexiones de Motor (mismos valores por defecto que pymongo)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0")) or None
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) or None
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+# Crear/verificar índices al arrancar la aplicación
+MONGO_INDICES_AL_INICIO = os.getenv("MONGO_INDICES_AL_INICIO", "1").lower() in ("1", "true", "si")
 
 client = AsyncIOMotorClient(
     MONGO_URI,
     server_api=ServerApi("1"),
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    event_listeners=[MonitorMongo()],
 )
 db = client[DATABASE_NAME]
 users_coll = db["users"]
 sessions_coll = db["sessions"]
+revocations_coll = db["revocations"]
+
+# Índices que necesitan las consultas de auth.py y login.py
+INDICES_USUARIOS = [
+    IndexModel([("email", ASCENDING)], unique=True),
+    IndexModel([("username", ASCENDING)], unique=True),
+    # Solo los usuarios con un reseteo pendiente tienen reset_token
+    IndexModel([("reset_token", ASCENDING)], sparse=True),
+]
+INDICES_SESIONES = [
+    IndexModel([("token", ASCENDING)]),
+    IndexModel([("user_id", ASCENDING)]),
+]
+# Lista de revocación del modo JWT: cada entrada caduca con el token que revoca
+INDICES_REVOCACIONES = [
+    IndexModel([("expira", ASCENDING)], expireAfterSeconds=0),
+    IndexModel([("creado", ASCENDING)]),
+]
+
+# Pasa a True cuando asegurar_indices() confirmó los índices únicos de usuarios
+_indices_usuarios_confirmados = False
+
+def indices_usuarios_confirmados() -> bool:
+    return _indices_usuarios_confirmados
+
+async def _asegurar_ttl(coll, campo: str, segundos: int):
+    """
+    Crea el índice TTL sobre `campo` o ajusta su expireAfterSeconds si ya
+    existe con otro valor (collMod, sin reconstruir el índice)
+    """
+    for nombre, info in (await coll.index_information()).items():
+        if info["key"] != [(campo, ASCENDING)]:
+            continue
+        if info.get("expireAfterSeconds") == segundos:
+            return
+        if "expireAfterSeconds" in info:
+            await db.command("collMod", coll.name, index={
+                "keyPattern": {campo: ASCENDING},
+                "expireAfterSeconds": segundos
+            })
+            return
+        # Índice normal sobre el mismo campo: se reemplaza por el TTL
+        await coll.drop_index(nombre)
+    await coll.create_index([(campo, ASCENDING)], expireAfterSeconds=segundos)
+
+async def asegurar_indices(ttl_sesiones: int):
+    """
+    Garantiza los índices de usuarios y sesiones. Las sesiones caducan por
+    TTL sobre created_at, `ttl_sesiones` segundos después del login.
+    Es idempotente: se puede ejecutar en cada arranque. Si un índice no se
+    puede crear (p. ej. duplicados que impiden un índice único) lanza
+    RuntimeError: /register depende de los índices únicos de usuarios.
+    """
+    global _indices_usuarios_confirmados
+    for coll, indices in (
+        (users_coll, INDICES_USUARIOS),
+        (sessions_coll, INDICES_SESIONES),
+        (revocations_coll, INDICES_REVOCACIONES)
+    ):
+        for indice in indices:
+            try:
+                await coll.create_indexes([indice])
+            except OperationFailure as e:
+                raise RuntimeError(
+                    f"No se pudo crear el índice {indice.document['name']} en {coll.name}: {e}"
+                ) from e
+        if coll is users_coll:
+            _indices_usuarios_confirmados = True
+    await _asegurar_ttl(sessions_coll, "created_at", ttl_sesiones)
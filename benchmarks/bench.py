@@ -0,0 +1,317 @@
+# Benchmark de las funciones de los filtros y de las rutas HTTP (cliente ASGI local)
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Antes de importar la aplicación: las rutas de filtros sin token
+os.environ.setdefault("AUTH_FILTROS", "0")
+
+import cv2
+import httpx
+import numpy as np
+from fastapi import HTTPException
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.corpus import CORPUS_DIR, cargar_corpus
+from filtros.backends_ocr import BackendOCR, resultado_ocrspace
+from filtros.cliente_ocr import servicio_ocr
+from filtros.recibo import ReciboDecodificado, normalizar_ancho
+from filtros.filtro_plin import is_plin_transaction, NotPlinTransaction
+from filtros.filtro_pixeles import detectar_diferencias, obtener_plantillas_pixeles
+from filtros.filtro_logo import detectar_logo_multiescala, LOGO_PLIN_PATH, ANCHO_LOGO
+from filtros.filtro_ruido import porcentaje_nitidez
+from filtros.filtro_histograma import compare_histograms, TEMPLATE_HISTOGRAM, HISTOGRAMA_ANCHO_MINIMO
+from filtros.filtro_analizar import anchos_requeridos, FILTROS_DISPONIBLES
+from filtros.filtro_claves import calcular_similitud, extraer_palabras, PLANTILLA_PLIN_INTERBANK
+from filtros.filtro_validarplin import validar_comprobante
+
+RUTAS = (
+    "/filter_plin", "/filtro_pixeles", "/filtro_ruido", "/filtro_logo/plin",
+    "/histograma", "/filtro_exif", "/ocr", "/filtro_ocr", "/validarplin",
+    "/analizar", "/analizar/cascada", "/analizar/lote",
+)
+# Resultados de negocio (p. ej. "no es Plin"), no fallos del benchmark
+RECHAZOS = (NotPlinTransaction, HTTPException)
+
+# Texto y posiciones de un comprobante Plin real (las de PLANTILLA_PLIN_INTERBANK)
+LINEAS_STUB = [
+    [("Interbank", 338, 80)],
+    [("plin", 380, 230)],
+    [("¡Pago", 293, 348), ("exitoso!", 404, 347)],
+    [("S/", 201, 428), ("25.00", 250, 428)],
+    [("Enviado", 102, 615), ("a:", 240, 615)],
+    [("Juan", 102, 670), ("Perez", 190, 670)],
+    [("987", 102, 722), ("654", 170, 722), ("321", 240, 722)],
+    [("Destino:", 102, 798)],
+    [("Yape", 100, 852)],
+    [("Comisión:", 101, 928)],
+    [("GRATIS", 117, 991)],
+    [("Fecha", 102, 1078), ("y", 210, 1078), ("hora:", 248, 1078)],
+    [("01", 102, 1131), ("Oct", 150, 1131), ("2025", 220, 1131), ("10:51", 350, 1131), ("PM", 460, 1131)],
+    [("Código", 101, 1207), ("de", 230, 1207), ("operación:", 293, 1207)],
+    [("12345678", 102, 1262)],
+]
+
+
+class BackendStub(BackendOCR):
+    """OCR simulado: siempre el mismo comprobante Plin, con latencia opcional"""
+    nombre = "stub"
+
+    def __init__(self, latencia_ms: float = 0.0):
+        self.latencia_ms = latencia_ms
+        self.respuesta = resultado_ocrspace([
+            [{"WordText": texto, "Left": x, "Top": y, "Width": 14 * len(texto), "Height": 30}
+             for texto, x, y in linea]
+            for linea in LINEAS_STUB
+        ])
+
+    async def reconocer(self, archivo, parametros, campo='file'):
+        if self.latencia_ms:
+            await asyncio.sleep(self.latencia_ms / 1000)
+        return 200, self.respuesta
+
+
+def rss_pico_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB; macOS, bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def resumir(nombre: str, latencias: List[float], errores: int, duracion: float, unidades: int = None) -> Dict:
+    """Percentiles en ms; rendimiento = unidades (peticiones o imágenes) por segundo de pared"""
+    ms = np.array(latencias) * 1000 if latencias else np.zeros(1)
+    return {
+        "caso": nombre,
+        "n": len(latencias),
+        "errores": errores,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "media_ms": round(float(ms.mean()), 2),
+        "por_segundo": round((unidades if unidades is not None else len(latencias)) / duracion, 2) if duracion else 0.0,
+        "rss_pico_mb": rss_pico_mb()
+    }
+
+
+# --- Funciones -----------------------------------------------------------
+
+def casos_funciones(stub: BackendStub) -> List[Tuple[str, Callable[[Dict], tuple], Callable]]:
+    """
+    (nombre, preparar(item) -> argumentos, función). La preparación (decodificar,
+    reescalar como en producción) queda fuera de la medición salvo en "decodificar".
+    """
+    logo = cv2.imread(LOGO_PLIN_PATH)
+    plantillas = obtener_plantillas_pixeles()
+    parsed = stub.respuesta["ParsedResults"][0]
+    palabras = extraer_palabras(stub.respuesta)
+
+    def recibo(item):
+        return ReciboDecodificado(item["contenido"]).decodificar()
+
+    def histogramas(item):
+        rgb = cv2.cvtColor(recibo(item).vista(HISTOGRAMA_ANCHO_MINIMO), cv2.COLOR_BGR2RGB)
+        h = Image.fromarray(rgb).histogram()
+        return h[0:256], h[256:512], h[512:768]
+
+    return [
+        ("decodificar", lambda item: (item["contenido"],),
+         lambda contenido: ReciboDecodificado(contenido).decodificar()),
+        # Todas las vistas de /analizar, cada una a su ancho mínimo
+        ("decodificar_analizar", lambda item: (item["contenido"],),
+         lambda contenido: ReciboDecodificado(contenido).decodificar(anchos_requeridos(FILTROS_DISPONIBLES))),
+        ("is_plin_transaction", lambda item: (item["contenido"],), is_plin_transaction),
+        ("detectar_diferencias", lambda item: (plantillas, recibo(item).gris), detectar_diferencias),
+        ("detectar_logo_multiescala",
+         lambda item: (normalizar_ancho(recibo(item).vista(ANCHO_LOGO), ANCHO_LOGO, ampliar=True), logo),
+         detectar_logo_multiescala),
+        ("porcentaje_nitidez", lambda item: (recibo(item).gris,), porcentaje_nitidez),
+        ("compare_histograms", histogramas,
+         lambda r, g, b: [compare_histograms(TEMPLATE_HISTOGRAM[c], h) for c, h in zip("rgb", (r, g, b))]),
+        ("calcular_similitud", lambda item: (PLANTILLA_PLIN_INTERBANK, palabras), calcular_similitud),
+        ("validar_comprobante", lambda item: (parsed,), validar_comprobante),
+    ]
+
+def medir_funciones(corpus: List[Dict], repeticiones: int, stub: BackendStub, solo: Optional[set]) -> List[Dict]:
+    resultados = []
+    for nombre, preparar, funcion in casos_funciones(stub):
+        if solo and nombre not in solo:
+            continue
+        argumentos = [preparar(item) for item in corpus]
+        # Calentamiento: plantillas, perfiles y cachés perezosas
+        funcion(*argumentos[0])
+        latencias, errores = [], 0
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            for args in argumentos:
+                t0 = time.perf_counter()
+                try:
+                    funcion(*args)
+                except RECHAZOS:
+                    pass
+                except Exception:
+                    errores += 1
+                latencias.append(time.perf_counter() - t0)
+        resultados.append(resumir(nombre, latencias, errores, time.perf_counter() - inicio))
+    return resultados
+
+
+# --- Rutas HTTP ----------------------------------------------------------
+
+def _archivo(item: Dict) -> Tuple[str, bytes, str]:
+    return item["archivo"], item["contenido"], f"image/{'jpeg' if item['formato'] == 'jpg' else item['formato']}"
+
+async def _medir_ruta(
+    cliente: httpx.AsyncClient,
+    ruta: str,
+    corpus: List[Dict],
+    repeticiones: int,
+    concurrencia: int
+) -> Dict:
+    if ruta == "/analizar/lote":
+        # Una petición = el corpus entero; el rendimiento se expresa en imágenes/s
+        peticiones = [{"files": [("files", _archivo(item)) for item in corpus]}] * repeticiones
+        unidades = len(corpus) * repeticiones
+    else:
+        peticiones = [{"files": {"file": _archivo(item)}} for item in corpus] * repeticiones
+        unidades = None
+
+    async def enviar(peticion) -> bool:
+        respuesta = await cliente.post(ruta, **peticion)
+        if ruta == "/analizar/lote":
+            await respuesta.aread()
+        # 4xx de negocio (p. ej. "no es Plin") cuentan como respuesta válida
+        return respuesta.status_code < 500
+
+    await enviar(peticiones[0])  # calentamiento
+
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias: List[float] = []
+    errores = 0
+
+    async def medida(peticion):
+        nonlocal errores
+        async with semaforo:
+            t0 = time.perf_counter()
+            try:
+                ok = await enviar(peticion)
+            except Exception:
+                ok = False
+            latencias.append(time.perf_counter() - t0)
+            errores += not ok
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(medida(p) for p in peticiones))
+    return resumir(ruta, latencias, errores, time.perf_counter() - inicio, unidades)
+
+async def medir_rutas(corpus: List[Dict], repeticiones: int, concurrencia: int, rutas) -> List[Dict]:
+    from main import app
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=120) as cliente:
+        return [await _medir_ruta(cliente, ruta, corpus, repeticiones, concurrencia) for ruta in rutas]
+
+
+# --- Informe -------------------------------------------------------------
+
+def imprimir_tabla(titulo: str, filas: List[Dict], base: Optional[Dict[str, Dict]] = None):
+    print(f"\n{titulo}")
+    cabecera = f"{'caso':<28}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'/s':>10}{'RSS MB':>9}"
+    if base:
+        cabecera += f"{'Δp50':>9}{'Δp95':>9}"
+    print(cabecera)
+    print("-" * len(cabecera))
+    for f in filas:
+        linea = (f"{f['caso']:<28}{f['n']:>6}{f['errores']:>5}{f['p50_ms']:>10.2f}{f['p95_ms']:>10.2f}"
+                 f"{f['p99_ms']:>10.2f}{f['por_segundo']:>10.2f}{f['rss_pico_mb'] or 0:>9.1f}")
+        anterior = (base or {}).get(f["caso"])
+        if anterior:
+            for clave in ("p50_ms", "p95_ms"):
+                delta = (f[clave] - anterior[clave]) / anterior[clave] * 100 if anterior[clave] else 0.0
+                linea += f"{delta:>+8.1f}%"
+        print(linea)
+
+def entorno(args) -> Dict:
+    from filtros.ejecutor import EJECUTOR_HILOS
+    from filtros.recibo import ANCHO_CANONICO
+
+    return {
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "ejecutor_hilos": EJECUTOR_HILOS,
+        "ancho_canonico": ANCHO_CANONICO,
+        "repeticiones": args.repeticiones,
+        "concurrencia": args.concurrencia,
+        "ocr_latencia_ms": args.ocr_latencia_ms
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de los filtros de comprobantes")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="directorio del corpus (se genera si no existe)")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--concurrencia", type=int, default=4, help="peticiones HTTP simultáneas")
+    parser.add_argument("--modo", choices=("todo", "funciones", "rutas"), default="todo")
+    parser.add_argument("--casos", help="subconjunto separado por comas (funciones o rutas)")
+    parser.add_argument("--variantes", help="p. ej. autentico,alterado")
+    parser.add_argument("--ocr-latencia-ms", type=float, default=0.0, help="latencia simulada del OCR")
+    parser.add_argument("--cache-ocr", action="store_true", help="mantener la caché OCR (por defecto se desactiva)")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para mostrar la variación")
+    args = parser.parse_args(argv)
+
+    corpus = cargar_corpus(args.corpus)
+    if args.variantes:
+        variantes = set(args.variantes.split(","))
+        corpus = [item for item in corpus if item["variante"] in variantes]
+    solo = set(args.casos.split(",")) if args.casos else None
+
+    stub = BackendStub(args.ocr_latencia_ms)
+    servicio_ocr.backend = stub
+    servicio_ocr.grabador = None
+    if not args.cache_ocr:
+        servicio_ocr.cache = None
+
+    base = None
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f)
+        base = {r["caso"]: r for r in anterior["funciones"] + anterior["rutas"]}
+
+    print(f"Corpus: {len(corpus)} imágenes de {args.corpus}; repeticiones={args.repeticiones}")
+    funciones, rutas = [], []
+    if args.modo in ("todo", "funciones"):
+        funciones = medir_funciones(corpus, args.repeticiones, stub, solo)
+        imprimir_tabla("Funciones (un hilo)", funciones, base)
+    if args.modo in ("todo", "rutas"):
+        seleccion = [r for r in RUTAS if not solo or r in solo]
+        rutas = asyncio.run(medir_rutas(corpus, args.repeticiones, args.concurrencia, seleccion))
+        imprimir_tabla(f"Rutas HTTP (concurrencia {args.concurrencia})", rutas, base)
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "entorno": entorno(args),
+                "corpus": [{k: v for k, v in item.items() if k != "contenido"} for item in corpus],
+                "funciones": funciones,
+                "rutas": rutas
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
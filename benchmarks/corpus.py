@@ -0,0 +1,138 @@
+# Corpus sintético de comprobantes para los benchmarks
+import json
+import os
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+PLANTILLA_BASE = "./filtros/plantillas/plin.jpg"
+CORPUS_DIR = "./benchmarks/corpus"
+# Anchos típicos de captura: pantallas pequeñas, la plantilla (833) y móviles HD
+ANCHOS_CORPUS = (600, 833, 1080, 1440)
+VARIANTES = ("autentico", "alterado", "recomprimido", "no_plin")
+CALIDAD_JPEG = 92
+
+
+def _redimensionar(imagen: np.ndarray, ancho: int) -> np.ndarray:
+    alto = round(imagen.shape[0] * ancho / imagen.shape[1])
+    interpolacion = cv2.INTER_AREA if ancho < imagen.shape[1] else cv2.INTER_CUBIC
+    return cv2.resize(imagen, (ancho, alto), interpolation=interpolacion)
+
+def _codificar(imagen: np.ndarray, extension: str = ".jpg", calidad: int = CALIDAD_JPEG) -> bytes:
+    parametros = [cv2.IMWRITE_JPEG_QUALITY, calidad] if extension == ".jpg" else []
+    ok, buffer = cv2.imencode(extension, imagen, parametros)
+    if not ok:
+        raise ValueError(f"No se pudo codificar la imagen como {extension}")
+    return buffer.tobytes()
+
+def alterar(imagen: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Simula una edición típica: se tapa el monto con un parche del fondo y se
+    escribe otro encima, y se copia un bloque de texto a otra altura
+    """
+    alterada = imagen.copy()
+    alto, ancho = alterada.shape[:2]
+    # Zona del monto (proporcional, válida para cualquier ancho)
+    x0, x1 = int(ancho * 0.20), int(ancho * 0.80)
+    y0, y1 = int(alto * 0.25), int(alto * 0.31)
+    fondo = alterada[y1:y1 + (y1 - y0), x0:x1]
+    alterada[y0:y1, x0:x1] = fondo[:y1 - y0]
+    monto = f"S/ {rng.integers(100, 999)}.{rng.integers(0, 99):02d}"
+    escala = ancho / 500
+    cv2.putText(alterada, monto, (x0, y1 - int(alto * 0.012)), cv2.FONT_HERSHEY_SIMPLEX,
+                escala, (40, 40, 40), max(1, round(escala * 2)), cv2.LINE_AA)
+    # Copia-pega de un bloque de texto (copy-move)
+    bloque = alterada[int(alto * 0.40):int(alto * 0.45), int(ancho * 0.1):int(ancho * 0.6)].copy()
+    destino = int(alto * 0.62)
+    alterada[destino:destino + bloque.shape[0], int(ancho * 0.1):int(ancho * 0.6)] = bloque
+    return alterada
+
+def recomprimir(imagen: np.ndarray) -> np.ndarray:
+    """Reenvío por mensajería: dos compresiones JPEG agresivas y un reescalado intermedio"""
+    primera = cv2.imdecode(np.frombuffer(_codificar(imagen, calidad=45), np.uint8), cv2.IMREAD_COLOR)
+    alto, ancho = primera.shape[:2]
+    reducida = cv2.resize(primera, (int(ancho * 0.85), int(alto * 0.85)), interpolation=cv2.INTER_AREA)
+    restaurada = cv2.resize(reducida, (ancho, alto), interpolation=cv2.INTER_LINEAR)
+    return cv2.imdecode(np.frombuffer(_codificar(restaurada, calidad=35), np.uint8), cv2.IMREAD_COLOR)
+
+def comprobante_no_plin(ancho: int, rng: np.random.Generator) -> np.ndarray:
+    """Comprobante genérico de otra billetera: cabecera roja, texto oscuro y ruido de cámara"""
+    alto = round(ancho * 1.92)
+    imagen = np.full((alto, ancho, 3), 246, np.uint8)
+    imagen[:int(alto * 0.14)] = (40, 40, 200)
+    escala = ancho / 700
+    y = int(alto * 0.22)
+    while y < alto * 0.9:
+        largo = int(rng.integers(6, 22))
+        texto = "".join(rng.choice(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 "), largo))
+        cv2.putText(imagen, texto, (int(ancho * 0.08), y), cv2.FONT_HERSHEY_SIMPLEX,
+                    escala, (30, 30, 30), max(1, round(escala * 2)), cv2.LINE_AA)
+        y += int(alto * rng.uniform(0.04, 0.07))
+    ruido = rng.normal(0, 4, imagen.shape)
+    return np.clip(imagen + ruido, 0, 255).astype(np.uint8)
+
+def generar_corpus(
+    directorio: str = CORPUS_DIR,
+    anchos=ANCHOS_CORPUS,
+    semilla: int = 7,
+    plantilla: str = PLANTILLA_BASE
+) -> List[Dict]:
+    """
+    Genera las variantes de cada ancho y escribe manifiesto.json. Con la
+    misma semilla el corpus es idéntico byte a byte entre ejecuciones.
+    """
+    base = cv2.imread(plantilla)
+    if base is None:
+        raise FileNotFoundError(f"No se encontró la plantilla base: {plantilla}")
+    rng = np.random.default_rng(semilla)
+    os.makedirs(directorio, exist_ok=True)
+
+    manifiesto = []
+    for ancho in anchos:
+        escalada = _redimensionar(base, ancho)
+        imagenes = {
+            "autentico": escalada,
+            "alterado": alterar(escalada, rng),
+            "recomprimido": recomprimir(escalada),
+            "no_plin": comprobante_no_plin(ancho, rng),
+        }
+        for variante in VARIANTES:
+            extensiones = [".jpg", ".png"] if variante == "autentico" and ancho == base.shape[1] else [".jpg"]
+            for extension in extensiones:
+                contenido = _codificar(imagenes[variante], extension)
+                nombre = f"{variante}_{ancho}{extension}"
+                with open(os.path.join(directorio, nombre), "wb") as f:
+                    f.write(contenido)
+                manifiesto.append({
+                    "archivo": nombre,
+                    "variante": variante,
+                    "ancho": imagenes[variante].shape[1],
+                    "alto": imagenes[variante].shape[0],
+                    "formato": extension.lstrip("."),
+                    "bytes": len(contenido)
+                })
+
+    with open(os.path.join(directorio, "manifiesto.json"), "w", encoding="utf-8") as f:
+        json.dump({"semilla": semilla, "imagenes": manifiesto}, f, ensure_ascii=False, indent=2)
+    return manifiesto
+
+def cargar_corpus(directorio: str = CORPUS_DIR) -> List[Dict]:
+    """Lee el manifiesto y los bytes de cada imagen (genera el corpus si no existe)"""
+    ruta_manifiesto = os.path.join(directorio, "manifiesto.json")
+    if not os.path.exists(ruta_manifiesto):
+        generar_corpus(directorio)
+    with open(ruta_manifiesto, "r", encoding="utf-8") as f:
+        manifiesto = json.load(f)["imagenes"]
+    for item in manifiesto:
+        with open(os.path.join(directorio, item["archivo"]), "rb") as f:
+            item["contenido"] = f.read()
+    return manifiesto
+
+
+if __name__ == "__main__":
+    import sys
+
+    directorio = sys.argv[1] if len(sys.argv) > 1 else CORPUS_DIR
+    imagenes = generar_corpus(directorio)
+    print(f"✅ {len(imagenes)} imágenes generadas en {directorio}")
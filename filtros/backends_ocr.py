@@ -0,0 +1,150 @@
+# Backends OCR locales con la misma estructura de respuesta que OCR.space
+import asyncio
+import hashlib
+import io
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+try:
+    import pytesseract
+except ImportError:  # Dependencia opcional
+    pytesseract = None
+
+
+def resultado_ocrspace(lineas: List[List[Dict]]) -> Dict:
+    """
+    Arma la respuesta normalizada de OCR.space (ParsedResults / Overlay)
+    a partir de líneas de palabras con WordText, Left, Top, Width y Height
+    """
+    lineas_overlay = []
+    for palabras in lineas:
+        if not palabras:
+            continue
+        lineas_overlay.append({
+            "LineText": " ".join(p["WordText"] for p in palabras),
+            "Words": palabras,
+            "MaxHeight": max(p["Height"] for p in palabras),
+            "MinTop": min(p["Top"] for p in palabras)
+        })
+    overlay = {"Lines": lineas_overlay, "HasOverlay": bool(lineas_overlay)}
+    return {
+        "ParsedResults": [{
+            "ParsedText": "\r\n".join(l["LineText"] for l in lineas_overlay),
+            "Overlay": overlay,
+            "TextOverlay": overlay,
+            "FileParseExitCode": 1
+        }],
+        "OCRExitCode": 1,
+        "IsErroredOnProcessing": False
+    }
+
+def resultado_error(mensaje: str) -> Dict:
+    return {
+        "ParsedResults": [],
+        "IsErroredOnProcessing": True,
+        "ErrorMessage": [mensaje]
+    }
+
+
+class BackendOCR:
+    """
+    Interfaz común: reconocer() devuelve (código HTTP, JSON con la forma de
+    OCR.space) para que los validadores no dependan del motor usado.
+    """
+    nombre = "base"
+
+    @property
+    def identificador(self) -> str:
+        """Distingue resultados de motores distintos en la caché"""
+        return self.nombre
+
+    async def reconocer(
+        self,
+        archivo: Tuple[str, bytes, str],
+        parametros: Dict[str, str],
+        campo: str = 'file'
+    ) -> Tuple[int, Dict]:
+        raise NotImplementedError
+
+    async def cerrar(self):
+        pass
+
+
+class BackendTesseract(BackendOCR):
+    """OCR en proceso con Tesseract (requiere pytesseract y el binario tesseract)"""
+    nombre = "tesseract"
+
+    def __init__(self, config: str = "--psm 6"):
+        if pytesseract is None:
+            raise RuntimeError("pytesseract no está instalado")
+        self.config = config
+
+    @property
+    def identificador(self) -> str:
+        return f"{self.nombre}:{self.config}"
+
+    def _reconocer(self, imagen_bytes: bytes, idioma: str) -> Dict:
+        imagen = Image.open(io.BytesIO(imagen_bytes)).convert("RGB")
+        data = pytesseract.image_to_data(
+            imagen, lang=idioma, config=self.config, output_type=pytesseract.Output.DICT
+        )
+        lineas: Dict[tuple, List[Dict]] = {}
+        for i, texto in enumerate(data["text"]):
+            texto = (texto or "").strip()
+            if not texto or float(data["conf"][i]) < 0:
+                continue
+            clave = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lineas.setdefault(clave, []).append({
+                "WordText": texto,
+                "Left": int(data["left"][i]),
+                "Top": int(data["top"][i]),
+                "Width": int(data["width"][i]),
+                "Height": int(data["height"][i])
+            })
+        return resultado_ocrspace([lineas[k] for k in sorted(lineas)])
+
+    async def reconocer(self, archivo, parametros, campo='file'):
+        idioma = parametros.get('language', 'spa')
+        try:
+            return 200, await asyncio.to_thread(self._reconocer, archivo[1], idioma)
+        except Exception as e:
+            return 200, resultado_error(f"Tesseract: {e}")
+
+
+class BackendFixtures(BackendOCR):
+    """
+    Reproduce respuestas grabadas: <directorio>/<sha256 de la imagen>.json
+    y, si no existe, <directorio>/default.json
+    """
+    nombre = "fixtures"
+
+    def __init__(self, directorio: str):
+        self.directorio = directorio
+
+    @property
+    def identificador(self) -> str:
+        return f"{self.nombre}:{self.directorio}"
+
+    def ruta_fixture(self, imagen_bytes: bytes) -> str:
+        return os.path.join(self.directorio, f"{hashlib.sha256(imagen_bytes).hexdigest()}.json")
+
+    def _leer(self, imagen_bytes: bytes) -> Optional[Dict]:
+        for ruta in (self.ruta_fixture(imagen_bytes), os.path.join(self.directorio, "default.json")):
+            if os.path.exists(ruta):
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        return None
+
+    async def reconocer(self, archivo, parametros, campo='file'):
+        datos = await asyncio.to_thread(self._leer, archivo[1])
+        if datos is None:
+            return 200, resultado_error(f"Sin fixture OCR en {self.directorio}")
+        return 200, datos
+
+    def grabar(self, imagen_bytes: bytes, datos: Dict):
+        os.makedirs(self.directorio, exist_ok=True)
+        with open(self.ruta_fixture(imagen_bytes), 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
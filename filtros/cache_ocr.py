@@ -0,0 +1,212 @@
+# Caché de resultados OCR direccionada por contenido
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OCR_CACHE_TAMANO = int(os.getenv("OCR_CACHE_TAMANO", "256"))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", str(24 * 3600)))
+# "" (solo memoria), "disco" o "mongo"
+OCR_CACHE_PERSISTENTE = os.getenv("OCR_CACHE_PERSISTENTE", "").lower()
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "./cache_ocr")
+
+def clave_ocr(imagen_bytes: bytes, parametros: Dict[str, str]) -> str:
+    """SHA-256 de la imagen enviada más los parámetros que afectan al resultado"""
+    h = hashlib.sha256(imagen_bytes)
+    h.update(json.dumps(parametros, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class CacheLRU:
+    """
+    Caché en memoria acotada por tamaño, con caducidad por entrada. Guarda y
+    entrega copias: quien modifique un resultado no altera los demás aciertos
+    """
+
+    def __init__(self, tamano: int = OCR_CACHE_TAMANO, ttl: int = OCR_CACHE_TTL):
+        self.tamano = tamano
+        self.ttl = ttl
+        self._datos: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[Dict]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+        return copy.deepcopy(valor)
+
+    def guardar(self, clave: str, valor: Dict):
+        if self.tamano <= 0:
+            return
+        valor = copy.deepcopy(valor)
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamano:
+                self._datos.popitem(last=False)
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class CacheDisco:
+    """Un archivo JSON por resultado; la caducidad se toma del mtime"""
+
+    def __init__(self, directorio: str = OCR_CACHE_DIR, ttl: int = OCR_CACHE_TTL):
+        self.directorio = directorio
+        self.ttl = ttl
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, clave[:2], f"{clave}.json")
+
+    def _leer(self, clave: str) -> Optional[Dict]:
+        ruta = self._ruta(clave)
+        try:
+            if time.time() - os.path.getmtime(ruta) > self.ttl:
+                os.unlink(ruta)
+                return None
+            with open(ruta, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _escribir(self, clave: str, valor: Dict):
+        ruta = self._ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Temporal propio de cada escritor: dos fallos simultáneos de la misma clave no se mezclan
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=f"{clave}.", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump(valor, f, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except OSError:
+                pass
+            raise
+
+    async def obtener(self, clave: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._leer, clave)
+
+    async def guardar(self, clave: str, valor: Dict):
+        await asyncio.to_thread(self._escribir, clave, valor)
+
+
+class CacheMongo:
+    """Colección con índice TTL sobre `creado`"""
+
+    def __init__(self, ttl: int = OCR_CACHE_TTL):
+        from bd import db
+        self.coll = db["ocr_cache"]
+        self.ttl = ttl
+        self._indice_creado = False
+
+    async def _asegurar_indice(self):
+        if not self._indice_creado:
+            await self.coll.create_index("creado", expireAfterSeconds=self.ttl)
+            self._indice_creado = True
+
+    async def obtener(self, clave: str) -> Optional[Dict]:
+        doc = await self.coll.find_one({
+            "_id": clave,
+            # El monitor TTL de Mongo borra cada ~60 s; filtramos lo caducado
+            "creado": {"$gt": datetime.utcnow() - timedelta(seconds=self.ttl)}
+        })
+        return doc["resultado"] if doc else None
+
+    async def guardar(self, clave: str, valor: Dict):
+        await self._asegurar_indice()
+        await self.coll.replace_one(
+            {"_id": clave},
+            {"_id": clave, "resultado": valor, "creado": datetime.utcnow()},
+            upsert=True
+        )
+
+
+class CacheOCR:
+    """
+    Caché en dos niveles: LRU en proceso y, opcionalmente, un nivel
+    persistente (disco o Mongo). Lleva contadores de aciertos y fallos.
+    """
+
+    def __init__(self, memoria: CacheLRU, persistente=None):
+        self.memoria = memoria
+        self.persistente = persistente
+        self.aciertos_memoria = 0
+        self.aciertos_persistente = 0
+        self.fallos = 0
+        self.guardados = 0
+        self.errores_persistente = 0
+
+    async def obtener(self, clave: str) -> Optional[Dict]:
+        valor = self.memoria.obtener(clave)
+        if valor is not None:
+            self.aciertos_memoria += 1
+            return valor
+        if self.persistente is not None:
+            try:
+                valor = await self.persistente.obtener(clave)
+            except Exception as e:
+                self.errores_persistente += 1
+                print(f"⚠️  Error leyendo caché OCR persistente: {e}")
+                valor = None
+            if valor is not None:
+                self.aciertos_persistente += 1
+                self.memoria.guardar(clave, valor)
+                return valor
+        self.fallos += 1
+        return None
+
+    async def guardar(self, clave: str, valor: Dict):
+        self.memoria.guardar(clave, valor)
+        self.guardados += 1
+        if self.persistente is not None:
+            try:
+                await self.persistente.guardar(clave, valor)
+            except Exception as e:
+                self.errores_persistente += 1
+                print(f"⚠️  Error guardando caché OCR persistente: {e}")
+
+    def estadisticas(self) -> Dict:
+        aciertos = self.aciertos_memoria + self.aciertos_persistente
+        consultas = aciertos + self.fallos
+        return {
+            "aciertos_memoria": self.aciertos_memoria,
+            "aciertos_persistente": self.aciertos_persistente,
+            "fallos": self.fallos,
+            "guardados": self.guardados,
+            "errores_persistente": self.errores_persistente,
+            "tasa_aciertos": round(aciertos / consultas, 4) if consultas else 0.0,
+            "entradas_memoria": len(self.memoria),
+            "nivel_persistente": OCR_CACHE_PERSISTENTE or None
+        }
+
+
+def crear_cache_ocr() -> CacheOCR:
+    persistente = None
+    if OCR_CACHE_PERSISTENTE == "disco":
+        persistente = CacheDisco()
+    elif OCR_CACHE_PERSISTENTE == "mongo":
+        persistente = CacheMongo()
+    return CacheOCR(CacheLRU(), persistente)
+
+
+cache_ocr = crear_cache_ocr()
@@ -0,0 +1,184 @@
+# Servicio OCR compartido: backend configurable (OCR.space, Tesseract, fixtures) + caché
+import asyncio
+import os
+import random
+from typing import Dict, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from filtros.cache_ocr import CacheOCR, cache_ocr, clave_ocr
+from filtros.backends_ocr import BackendOCR, BackendTesseract, BackendFixtures
+from filtros.metricas import medir, metricas
+
+load_dotenv()
+
+OCR_API_URL = os.getenv("OCR_API_URL", "https://api.ocr.space/parse/image")
+OCR_API_KEY = os.getenv("OCR_API_KEY", "e0b0a3ad7d88957")
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "30"))
+OCR_MAX_CONEXIONES = int(os.getenv("OCR_MAX_CONEXIONES", "10"))
+OCR_MAX_CONCURRENCIA = int(os.getenv("OCR_MAX_CONCURRENCIA", "10"))
+OCR_REINTENTOS = int(os.getenv("OCR_REINTENTOS", "2"))
+OCR_BACKOFF = float(os.getenv("OCR_BACKOFF", "0.5"))
+# "ocrspace" (remoto), "tesseract" (local) o "fixtures" (respuestas grabadas)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "ocrspace").lower()
+OCR_FIXTURES_DIR = os.getenv("OCR_FIXTURES_DIR", "./fixtures_ocr")
+# Si se define, las respuestas del backend remoto se graban como fixtures
+OCR_GRABAR_FIXTURES = os.getenv("OCR_GRABAR_FIXTURES", "").lower() in ("1", "true", "si")
+
+# Respuestas que vale la pena reintentar
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+class ClienteOCR(BackendOCR):
+    """
+    Backend remoto de OCR.space: cliente HTTP asíncrono con conexiones
+    keep-alive reutilizables, límite de peticiones simultáneas y reintentos
+    con backoff exponencial.
+    """
+    nombre = "ocrspace"
+
+    def __init__(
+        self,
+        url: str = OCR_API_URL,
+        api_key: str = OCR_API_KEY,
+        timeout: float = OCR_TIMEOUT,
+        max_conexiones: int = OCR_MAX_CONEXIONES,
+        max_concurrencia: int = OCR_MAX_CONCURRENCIA,
+        reintentos: int = OCR_REINTENTOS,
+        backoff: float = OCR_BACKOFF
+    ):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_conexiones = max_conexiones
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self._cliente: Optional[httpx.AsyncClient] = None
+
+    def _obtener_cliente(self) -> httpx.AsyncClient:
+        if self._cliente is None or self._cliente.is_closed:
+            self._cliente = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_conexiones,
+                    max_keepalive_connections=self.max_conexiones
+                )
+            )
+        return self._cliente
+
+    async def enviar(
+        self,
+        archivo: Tuple[str, bytes, str],
+        parametros: Dict[str, str],
+        campo: str = 'file'
+    ) -> httpx.Response:
+        """
+        Envía la imagen al OCR. Reintenta ante errores de red y respuestas
+        429/5xx; la última respuesta se devuelve tal cual para que cada
+        filtro la interprete. Lanza httpx.TimeoutException o
+        httpx.TransportError si se agotan los reintentos.
+        """
+        datos = {'apikey': self.api_key, **parametros}
+        intento = 0
+        while True:
+            try:
+                async with self._semaforo:
+                    respuesta = await self._obtener_cliente().post(
+                        self.url,
+                        data=datos,
+                        files={campo: archivo}
+                    )
+                if respuesta.status_code not in ESTADOS_REINTENTABLES or intento >= self.reintentos:
+                    return respuesta
+            except httpx.TransportError:
+                if intento >= self.reintentos:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** intento) * (1 + random.random() * 0.1))
+            intento += 1
+
+    @property
+    def identificador(self) -> str:
+        return f"{self.nombre}:{self.url}"
+
+    async def reconocer(
+        self,
+        archivo: Tuple[str, bytes, str],
+        parametros: Dict[str, str],
+        campo: str = 'file'
+    ) -> Tuple[int, Dict]:
+        respuesta = await self.enviar(archivo, parametros, campo)
+        try:
+            datos = respuesta.json()
+        except ValueError:
+            if respuesta.status_code == 200:
+                raise
+            datos = {}
+        return respuesta.status_code, datos
+
+    async def cerrar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+
+class ServicioOCR:
+    """Punto de entrada único de los filtros: caché por contenido + backend OCR"""
+
+    def __init__(
+        self,
+        backend: BackendOCR,
+        cache: Optional[CacheOCR] = cache_ocr,
+        grabador: Optional[BackendFixtures] = None
+    ):
+        self.backend = backend
+        self.cache = cache
+        self.grabador = grabador
+
+    async def consultar(
+        self,
+        archivo: Tuple[str, bytes, str],
+        parametros: Dict[str, str],
+        campo: str = 'file'
+    ) -> Tuple[int, Dict]:
+        """
+        Devuelve (código HTTP, JSON con la forma de OCR.space) consultando
+        antes la caché. Solo se guardan respuestas 200 sin error de OCR.
+        """
+        clave = clave_ocr(archivo[1], {**parametros, "backend": self.backend.identificador})
+        if self.cache is not None:
+            datos = await self.cache.obtener(clave)
+            metricas.incrementar(
+                "ocr_cache_consultas_total", 1, "Consultas a la caché OCR",
+                resultado="acierto" if datos is not None else "fallo"
+            )
+            if datos is not None:
+                return 200, datos
+
+        with medir(f"ocr_{self.backend.nombre}"):
+            status_code, datos = await self.backend.reconocer(archivo, parametros, campo)
+
+        if (status_code == 200 and isinstance(datos, dict)
+                and not datos.get('IsErroredOnProcessing')):
+            if self.cache is not None:
+                await self.cache.guardar(clave, datos)
+            if self.grabador is not None:
+                self.grabador.grabar(archivo[1], datos)
+        return status_code, datos
+
+    async def cerrar(self):
+        await self.backend.cerrar()
+
+
+def crear_backend(nombre: str = OCR_BACKEND) -> BackendOCR:
+    if nombre == "tesseract":
+        return BackendTesseract()
+    if nombre == "fixtures":
+        return BackendFixtures(OCR_FIXTURES_DIR)
+    return ClienteOCR()
+
+
+servicio_ocr = ServicioOCR(
+    crear_backend(),
+    grabador=BackendFixtures(OCR_FIXTURES_DIR) if OCR_GRABAR_FIXTURES and OCR_BACKEND == "ocrspace" else None
+)
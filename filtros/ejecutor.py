@@ -0,0 +1,157 @@
+# Pool acotado para el cómputo de los filtros (OpenCV, PIL, numpy)
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv()
+
+EJECUTOR_HILOS = int(os.getenv("EJECUTOR_HILOS", str(os.cpu_count() or 4)))
+# Trabajos admitidos a la vez (en ejecución + en cola) antes de responder 503
+EJECUTOR_MAX_PENDIENTES = int(os.getenv("EJECUTOR_MAX_PENDIENTES", str(max(16, EJECUTOR_HILOS * 4))))
+EJECUTOR_TIMEOUT = float(os.getenv("EJECUTOR_TIMEOUT", "30"))
+EJECUTOR_RETRY_AFTER = int(os.getenv("EJECUTOR_RETRY_AFTER", "2"))
+
+
+class _Cupo:
+    """
+    Cupo de una petición: se devuelve cuando la petición terminó y además
+    ya no queda ninguno de sus trabajos corriendo en el pool
+    """
+
+    def __init__(self, liberar: Callable[[], None]):
+        self._liberar = liberar
+        self._trabajos = 0
+        self._cerrado = False
+        self._lock = threading.Lock()
+
+    def registrar(self, futuro):
+        with self._lock:
+            self._trabajos += 1
+        futuro.add_done_callback(self._terminado)
+
+    def _terminado(self, _futuro):
+        with self._lock:
+            self._trabajos -= 1
+            liberar = self._cerrado and self._trabajos == 0
+        if liberar:
+            self._liberar()
+
+    def cerrar(self):
+        with self._lock:
+            self._cerrado = True
+            liberar = self._trabajos == 0
+        if liberar:
+            self._liberar()
+
+
+# Cupo de la petición en curso; las tareas creadas dentro de cupo() lo heredan
+_cupo_actual: contextvars.ContextVar[Optional[_Cupo]] = contextvars.ContextVar("cupo_ejecutor", default=None)
+
+
+class EjecutorFiltros:
+    """
+    Ejecuta funciones bloqueantes en un pool de hilos para no detener el
+    event loop. OpenCV libera el GIL en la mayoría de sus llamadas, así que
+    varios análisis corren realmente en paralelo.
+
+    - Si ya hay `max_pendientes` trabajos en curso se responde 503 con Retry-After.
+    - Si un trabajo supera `timeout` segundos se responde 504.
+    - Un endpoint que reparte varios trabajos (p. ej. /analizar) reserva un
+      solo cupo con `cupo()` y lanza sus trabajos con `ejecutar_en_cupo()`;
+      el cupo se devuelve cuando termina el último de esos trabajos.
+    """
+
+    def __init__(
+        self,
+        hilos: int = EJECUTOR_HILOS,
+        max_pendientes: int = EJECUTOR_MAX_PENDIENTES,
+        timeout: float = EJECUTOR_TIMEOUT,
+        retry_after: int = EJECUTOR_RETRY_AFTER
+    ):
+        self.hilos = hilos
+        self.max_pendientes = max_pendientes
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="filtros")
+        self._pendientes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pendientes(self) -> int:
+        return self._pendientes
+
+    def _admitir(self):
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                raise HTTPException(
+                    status_code=503,
+                    detail="❌ Servicio saturado, intenta nuevamente en unos segundos",
+                    headers={"Retry-After": str(self.retry_after)}
+                )
+            self._pendientes += 1
+
+    def _liberar(self, _futuro=None):
+        with self._lock:
+            self._pendientes -= 1
+
+    @contextmanager
+    def cupo(self):
+        """
+        Reserva un único cupo para todos los trabajos de una petición. Igual
+        que en `ejecutar`, si un trabajo venció el timeout el cupo sigue
+        ocupado hasta que su hilo termine.
+        """
+        self._admitir()
+        estado = _Cupo(self._liberar)
+        anterior = _cupo_actual.get()
+        # set() en lugar de reset(): el bloque puede cerrarse desde otro contexto
+        _cupo_actual.set(estado)
+        try:
+            yield
+        finally:
+            _cupo_actual.set(anterior)
+            estado.cerrar()
+
+    async def ejecutar(self, funcion: Callable[..., Any], *args, **kwargs) -> Any:
+        self._admitir()
+        # El cupo se libera cuando termina el hilo, no cuando vence el timeout:
+        # un trabajo abandonado sigue ocupando su lugar mientras corre.
+        futuro = self._enviar(funcion, *args, **kwargs)
+        futuro.add_done_callback(self._liberar)
+        return await self._esperar(futuro)
+
+    async def ejecutar_en_cupo(self, funcion: Callable[..., Any], *args, **kwargs) -> Any:
+        """Ejecuta sin pasar por la admisión (quien llama ya tiene un cupo())"""
+        futuro = self._enviar(funcion, *args, **kwargs)
+        estado = _cupo_actual.get()
+        if estado is not None:
+            estado.registrar(futuro)
+        return await self._esperar(futuro)
+
+    def _enviar(self, funcion: Callable[..., Any], *args, **kwargs):
+        # Copia del contexto (como asyncio.to_thread): el hilo ve las métricas de la petición
+        contexto = contextvars.copy_context()
+        return self._pool.submit(functools.partial(contexto.run, funcion, *args, **kwargs))
+
+    async def _esperar(self, futuro) -> Any:
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(futuro), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail=f"❌ El análisis superó el tiempo máximo ({self.timeout:.0f} s)"
+            )
+
+    def cerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+ejecutor = EjecutorFiltros()
@@ -0,0 +1,243 @@
+# Análisis unificado: una sola subida y una sola decodificación para todos los filtros
+import asyncio
+from typing import Callable, Dict, Iterable, Optional, Set
+import cv2
+from fastapi import APIRouter, File, UploadFile, HTTPException
+from PIL import Image
+
+from filtros.subida import leer_imagen
+from filtros.recibo import ReciboDecodificado, ANCHO_CANONICO
+from filtros.filtro_plin import evaluar_colores_plin, NotPlinTransaction, PLIN_ANCHO_MINIMO
+from filtros.filtro_pixeles import evaluar_pixeles
+from filtros.filtro_exif import extraer_exif
+from filtros.filtro_ruido import porcentaje_nitidez, clasificar_autenticidad as clasificar_nitidez, NITIDEZ_ANCHO_MINIMO
+from filtros.filtro_histograma import evaluar_histograma, HISTOGRAMA_ANCHO_MINIMO
+from filtros.filtro_logo import analizar_logo, TipoLogo, ANCHO_LOGO
+from filtros.filtro_claves import ocr_api_bytes, evaluar_claves
+from filtros.filtro_ocr import evaluar_texto_plin
+from filtros.filtro_validarplin import validar_comprobante
+from filtros.ejecutor import ejecutor
+
+router = APIRouter()
+
+def _advertencia_por_validez(es_valido: bool) -> str:
+    return "Auténtico" if es_valido else "Sospechoso"
+
+async def _capturar(funcion: Callable[..., Dict], *args) -> Dict:
+    """
+    Ejecuta un filtro en el pool (dentro del cupo de la petición) y convierte
+    sus errores en un resultado no válido
+    """
+    try:
+        return await ejecutor.ejecutar_en_cupo(funcion, *args)
+    except HTTPException as e:
+        return {"es_valido": False, "error": e.detail}
+    except Exception as e:
+        return {"es_valido": False, "error": f"❌ {str(e)}"}
+
+def filtro_plin(recibo: ReciboDecodificado) -> Dict:
+    try:
+        hsv = cv2.cvtColor(recibo.vista(PLIN_ANCHO_MINIMO), cv2.COLOR_BGR2HSV)
+        resultado = evaluar_colores_plin(hsv)
+        return {"es_valido": True, "advertencia": "Auténtico", **resultado}
+    except NotPlinTransaction as e:
+        return {"es_valido": False, "advertencia": "Alterado", "mensaje": f"❌ {str(e)}"}
+
+def filtro_pixeles(recibo: ReciboDecodificado) -> Dict:
+    resultado = evaluar_pixeles(recibo.gris)
+    return {"es_valido": resultado["advertencia"] == "Auténtico", **resultado}
+
+def filtro_exif(recibo: ReciboDecodificado) -> Dict:
+    resultado, mensaje = extraer_exif(recibo.contenido)
+    if resultado is None:
+        raise HTTPException(status_code=500, detail=mensaje)
+    if resultado["editado"]:
+        advertencia = "Alterado"
+    elif mensaje == "Sospechoso" or resultado["advertencia_formato"]:
+        advertencia = "Sospechoso"
+    else:
+        advertencia = "Auténtico"
+    return {
+        "es_valido": advertencia == "Auténtico",
+        "advertencia": advertencia,
+        "mensaje": mensaje,
+        "editado": resultado["editado"],
+        "tiene_gps": resultado["tiene_gps"],
+        "exif": resultado["datos"],
+        "advertencia_formato": resultado["advertencia_formato"]
+    }
+
+def filtro_ruido(recibo: ReciboDecodificado) -> Dict:
+    # Ancho canónico, pero reducido desde la decodificación completa (NITIDEZ_ANCHO_MINIMO)
+    porcentaje = porcentaje_nitidez(recibo.vista(recibo.ancho_canonico, completa=True))
+    advertencia = clasificar_nitidez(porcentaje)
+    return {
+        "es_valido": advertencia == "Auténtico",
+        "advertencia": advertencia,
+        "porcentaje_nitidez": round(porcentaje, 2)
+    }
+
+def filtro_histograma(recibo: ReciboDecodificado) -> Dict:
+    rgb = cv2.cvtColor(recibo.vista(HISTOGRAMA_ANCHO_MINIMO), cv2.COLOR_BGR2RGB)
+    resultado = evaluar_histograma(Image.fromarray(rgb))
+    return {
+        "es_valido": resultado["advertencia"] == "Auténtico",
+        "advertencia": resultado["advertencia"],
+        "similitud": resultado["similitud"]
+    }
+
+def filtro_logo(recibo: ReciboDecodificado, tipo_logo: TipoLogo = TipoLogo.PLIN) -> Dict:
+    resultado = analizar_logo(recibo.vista(ANCHO_LOGO), tipo_logo)
+    if not resultado["logo_detectado"]:
+        resultado["advertencia"] = "Alterado"
+    return resultado
+
+async def filtros_ocr(recibo: ReciboDecodificado) -> Dict[str, Dict]:
+    """
+    Una sola llamada al OCR alimenta los tres validadores de texto
+    (/ocr, /filtro_ocr y /validarplin)
+    """
+    data_ocr = await ocr_api_bytes(recibo.contenido)
+    resultados = {}
+
+    resultados["claves"] = await _capturar(evaluar_claves, data_ocr)
+
+    parsed_results = (data_ocr or {}).get("ParsedResults") or [{}]
+    primero = parsed_results[0]
+    texto = (primero.get("ParsedText") or "").strip()
+
+    def estructura():
+        resultado = evaluar_texto_plin(texto)
+        es_valido = not any(a.startswith("❌") for a in resultado["advertencias"])
+        return {"es_valido": es_valido, "advertencia": _advertencia_por_validez(es_valido), **resultado}
+
+    def comprobante():
+        if not primero or data_ocr.get("IsErroredOnProcessing"):
+            raise HTTPException(status_code=422, detail=data_ocr.get("ErrorMessage", "OCR falló"))
+        resultado = validar_comprobante(primero)
+        return {"es_valido": resultado["valido"], "advertencia": _advertencia_por_validez(resultado["valido"]), **resultado}
+
+    resultados["estructura"], resultados["validarplin"] = await asyncio.gather(
+        _capturar(estructura),
+        _capturar(comprobante)
+    )
+    return resultados
+
+def combinar_veredicto(resultados: Dict[str, Dict]) -> Dict:
+    """
+    Alterado si algún filtro lo marca como alterado, Auténtico si todos los
+    filtros evaluados son auténticos y Sospechoso en cualquier otro caso
+    """
+    resumen = {"Auténtico": 0, "Sospechoso": 0, "Alterado": 0, "error": 0}
+    for resultado in resultados.values():
+        if "error" in resultado:
+            resumen["error"] += 1
+        else:
+            resumen[resultado.get("advertencia", "Sospechoso")] += 1
+
+    if resumen["Alterado"]:
+        veredicto = "Alterado"
+    elif resumen["Sospechoso"] or resumen["error"]:
+        veredicto = "Sospechoso"
+    else:
+        veredicto = "Auténtico"
+    return {"veredicto": veredicto, "es_valido": veredicto == "Auténtico", "resumen": resumen}
+
+# Filtros disponibles para /analizar y /analizar/lote
+FILTROS_IMAGEN = {
+    "plin": filtro_plin,
+    "pixeles": filtro_pixeles,
+    "exif": filtro_exif,
+    "ruido": filtro_ruido,
+    "histograma": filtro_histograma,
+    "logo": filtro_logo,
+}
+FILTROS_DISPONIBLES = (*FILTROS_IMAGEN, "ocr")
+
+# Ancho mínimo (px) que necesita cada filtro; 0 = decodificación completa.
+# El EXIF solo lee la cabecera y el OCR recibe los bytes originales (None).
+RESOLUCION_FILTROS = {
+    "plin": PLIN_ANCHO_MINIMO,
+    "pixeles": ANCHO_CANONICO,
+    "exif": None,
+    "ruido": NITIDEZ_ANCHO_MINIMO,
+    "histograma": HISTOGRAMA_ANCHO_MINIMO,
+    "logo": ANCHO_LOGO,
+    "ocr": None,
+}
+
+def anchos_requeridos(filtros: Iterable[str]) -> Set[int]:
+    """Vistas que hay que preparar para los filtros seleccionados"""
+    return {RESOLUCION_FILTROS[f] for f in filtros if RESOLUCION_FILTROS.get(f) is not None}
+
+def parsear_filtros(filtros: Optional[str]) -> Set[str]:
+    """Convierte "plin,logo,ocr" en un conjunto validado; vacío = todos"""
+    if not filtros:
+        return set(FILTROS_DISPONIBLES)
+    seleccion = {f.strip().lower() for f in filtros.split(",") if f.strip()}
+    desconocidos = seleccion - set(FILTROS_DISPONIBLES)
+    if desconocidos:
+        raise HTTPException(
+            status_code=422,
+            detail=f"❌ Filtros desconocidos: {', '.join(sorted(desconocidos))}. "
+                   f"Disponibles: {', '.join(FILTROS_DISPONIBLES)}"
+        )
+    return seleccion
+
+async def analizar_recibo(
+    recibo: ReciboDecodificado,
+    tipo_logo: TipoLogo = TipoLogo.PLIN,
+    incluir_ocr: bool = True,
+    filtros: Optional[Set[str]] = None
+) -> Dict:
+    if filtros is None:
+        filtros = set(FILTROS_DISPONIBLES)
+    # Los filtros corren en paralelo en el pool; el OCR (E/S) se solapa con ellos
+    tareas = {
+        nombre: _capturar(funcion, recibo, tipo_logo) if nombre == "logo" else _capturar(funcion, recibo)
+        for nombre, funcion in FILTROS_IMAGEN.items()
+        if nombre in filtros
+    }
+    ocr = filtros_ocr(recibo) if incluir_ocr and "ocr" in filtros else None
+    valores = await asyncio.gather(*tareas.values(), *([ocr] if ocr else []))
+
+    resultados = dict(zip(tareas, valores))
+    if ocr:
+        resultados.update(valores[-1])
+
+    return {
+        **combinar_veredicto(resultados),
+        "dimensiones": f"{recibo.ancho}x{recibo.alto}",
+        "filtros": resultados
+    }
+
+@router.post("/analizar")
+async def analizar(
+    file: UploadFile = File(...),
+    tipo_logo: TipoLogo = TipoLogo.PLIN,
+    incluir_ocr: bool = True
+):
+    """
+    Ejecuta todos los filtros sobre una única subida y devuelve un veredicto combinado
+    """
+    content = (await leer_imagen(file)).contenido
+    with ejecutor.cupo():
+        try:
+            recibo = ReciboDecodificado(content)
+            # Decodifica antes de repartir los filtros entre hilos, solo al ancho que necesitan
+            await ejecutor.ejecutar_en_cupo(recibo.decodificar, anchos_requeridos(FILTROS_DISPONIBLES))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"❌ {str(e)}")
+
+        try:
+            return {
+                "archivo": file.filename,
+                **(await analizar_recibo(recibo, tipo_logo, incluir_ocr))
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"❌ Error inesperado: {str(e)}"
+            )
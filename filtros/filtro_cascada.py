@@ -0,0 +1,210 @@
+# Cascada de filtros: del más barato al más caro, con corte temprano y estadísticas por etapa
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from dotenv import load_dotenv
+from fastapi import APIRouter, File, UploadFile, HTTPException
+
+from filtros.subida import leer_imagen
+from filtros.recibo import ReciboDecodificado
+from filtros.filtro_analizar import (
+    FILTROS_IMAGEN, FILTROS_DISPONIBLES, _capturar, filtros_ocr, combinar_veredicto, parsear_filtros,
+    anchos_requeridos
+)
+from filtros.filtro_logo import TipoLogo
+from filtros.ejecutor import ejecutor
+
+load_dotenv()
+
+# Orden por defecto: costo creciente (ms -> cientos de ms -> segundos por red)
+CASCADA_ORDEN = os.getenv("CASCADA_ORDEN", "plin,exif,histograma,ruido,pixeles,logo,ocr")
+# Etapas cuyo resultado "Alterado" detiene la cascada
+CASCADA_CORTE = os.getenv("CASCADA_CORTE", "plin,exif")
+# Muestras de tiempo que se guardan por etapa para los percentiles
+CASCADA_MUESTRAS = int(os.getenv("CASCADA_MUESTRAS", "1000"))
+
+router = APIRouter()
+
+def _lista(valor: str) -> List[str]:
+    return [v.strip().lower() for v in valor.split(",") if v.strip()]
+
+
+class EstadisticasEtapa:
+    def __init__(self, muestras: int = CASCADA_MUESTRAS):
+        self.ejecuciones = 0
+        self.cortes = 0
+        self.alterados = 0
+        self.errores = 0
+        self.omitidas = 0
+        self.tiempo_total_ms = 0.0
+        self._tiempos = deque(maxlen=muestras)
+
+    def registrar(self, tiempo_ms: float, resultados: Iterable[Dict], corto: bool):
+        self.ejecuciones += 1
+        self.tiempo_total_ms += tiempo_ms
+        self._tiempos.append(tiempo_ms)
+        resultados = list(resultados)
+        self.alterados += any(r.get("advertencia") == "Alterado" for r in resultados)
+        self.errores += any("error" in r for r in resultados)
+        self.cortes += corto
+
+    def resumen(self) -> Dict:
+        tiempos = np.array(self._tiempos) if self._tiempos else None
+        return {
+            "ejecuciones": self.ejecuciones,
+            "omitidas": self.omitidas,
+            "cortes": self.cortes,
+            "alterados": self.alterados,
+            "errores": self.errores,
+            "tasa_rechazo": round(self.alterados / self.ejecuciones, 4) if self.ejecuciones else 0.0,
+            "tiempo_medio_ms": round(self.tiempo_total_ms / self.ejecuciones, 2) if self.ejecuciones else 0.0,
+            "tiempo_p50_ms": round(float(np.percentile(tiempos, 50)), 2) if tiempos is not None else 0.0,
+            "tiempo_p95_ms": round(float(np.percentile(tiempos, 95)), 2) if tiempos is not None else 0.0,
+        }
+
+
+class Cascada:
+    """
+    Ejecuta las etapas en `orden` una tras otra. Si una etapa de `corte`
+    devuelve "Alterado", las siguientes no se ejecutan (p. ej. no se paga el
+    OCR de algo que ni siquiera es un Plin). Registra tiempo y tasa de
+    rechazo por etapa para poder reajustar el orden.
+    """
+
+    def __init__(self, orden: Iterable[str] = None, corte: Iterable[str] = None):
+        self.orden = list(orden if orden is not None else _lista(CASCADA_ORDEN))
+        self.corte = set(corte if corte is not None else _lista(CASCADA_CORTE))
+        desconocidas = (set(self.orden) | self.corte) - set(FILTROS_DISPONIBLES)
+        if desconocidas:
+            raise ValueError(f"Etapas desconocidas en la cascada: {', '.join(sorted(desconocidas))}")
+        self.estadisticas = {nombre: EstadisticasEtapa() for nombre in self.orden}
+        self.analisis = 0
+        self.cortados = 0
+
+    def anchos_iniciales(self, filtros: Optional[Set[str]] = None) -> Set[int]:
+        """
+        Vista de la primera etapa que usa píxeles. Las demás se decodifican
+        al llegar a ellas (las etapas no se solapan), así un corte temprano
+        no paga la decodificación que necesitan las etapas caras.
+        """
+        for nombre in self.orden:
+            if filtros is None or nombre in filtros:
+                anchos = anchos_requeridos([nombre])
+                if anchos:
+                    return anchos
+        return set()
+
+    async def _ejecutar_etapa(self, nombre: str, recibo: ReciboDecodificado, tipo_logo: TipoLogo) -> Dict[str, Dict]:
+        if nombre == "ocr":
+            return await filtros_ocr(recibo)
+        if nombre == "logo":
+            return {nombre: await _capturar(FILTROS_IMAGEN[nombre], recibo, tipo_logo)}
+        return {nombre: await _capturar(FILTROS_IMAGEN[nombre], recibo)}
+
+    async def analizar(
+        self,
+        recibo: ReciboDecodificado,
+        tipo_logo: TipoLogo = TipoLogo.PLIN,
+        filtros: Optional[Set[str]] = None
+    ) -> Dict:
+        resultados: Dict[str, Dict] = {}
+        tiempos: Dict[str, float] = {}
+        cortado_en = None
+        etapas = [e for e in self.orden if filtros is None or e in filtros]
+
+        for i, nombre in enumerate(etapas):
+            inicio = time.perf_counter()
+            salida = await self._ejecutar_etapa(nombre, recibo, tipo_logo)
+            tiempos[nombre] = round((time.perf_counter() - inicio) * 1000, 2)
+            resultados.update(salida)
+
+            corta = nombre in self.corte and any(
+                r.get("advertencia") == "Alterado" for r in salida.values()
+            )
+            self.estadisticas[nombre].registrar(tiempos[nombre], salida.values(), corta)
+            if corta:
+                cortado_en = nombre
+                for restante in etapas[i + 1:]:
+                    self.estadisticas[restante].omitidas += 1
+                break
+
+        self.analisis += 1
+        self.cortados += cortado_en is not None
+        return {
+            **combinar_veredicto(resultados),
+            "dimensiones": f"{recibo.ancho}x{recibo.alto}",
+            "cortado_en": cortado_en,
+            "etapas_omitidas": etapas[len(tiempos):],
+            "tiempos_ms": tiempos,
+            "filtros": resultados
+        }
+
+    def orden_sugerido(self) -> List[str]:
+        """
+        Orden que minimiza el costo esperado: primero las etapas con menor
+        costo por rechazo (tiempo medio / tasa de rechazo). Las etapas sin
+        datos o sin rechazos conservan su posición relativa al final.
+        """
+        def clave(nombre: str):
+            resumen = self.estadisticas[nombre].resumen()
+            if not resumen["ejecuciones"] or not resumen["tasa_rechazo"]:
+                return (1, self.orden.index(nombre))
+            return (0, resumen["tiempo_medio_ms"] / resumen["tasa_rechazo"])
+        return sorted(self.orden, key=clave)
+
+    def resumen(self) -> Dict:
+        return {
+            "orden": self.orden,
+            "corte": sorted(self.corte),
+            "analisis": self.analisis,
+            "cortados": self.cortados,
+            "tasa_corte": round(self.cortados / self.analisis, 4) if self.analisis else 0.0,
+            "etapas": {nombre: e.resumen() for nombre, e in self.estadisticas.items()},
+            "orden_sugerido": self.orden_sugerido()
+        }
+
+    def reiniciar(self):
+        self.estadisticas = {nombre: EstadisticasEtapa() for nombre in self.orden}
+        self.analisis = 0
+        self.cortados = 0
+
+
+cascada = Cascada()
+
+@router.post("/analizar/cascada")
+async def analizar_cascada(
+    file: UploadFile = File(...),
+    tipo_logo: TipoLogo = TipoLogo.PLIN,
+    filtros: Optional[str] = None
+):
+    """
+    Ejecuta los filtros del más barato al más caro y se detiene en cuanto
+    una etapa de corte marca el recibo como alterado
+    """
+    seleccion = parsear_filtros(filtros)
+
+    content = (await leer_imagen(file)).contenido
+    with ejecutor.cupo():
+        try:
+            recibo = ReciboDecodificado(content)
+            await ejecutor.ejecutar_en_cupo(recibo.decodificar, cascada.anchos_iniciales(seleccion))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"❌ {str(e)}")
+
+        return {
+            "archivo": file.filename,
+            **(await cascada.analizar(recibo, tipo_logo, seleccion))
+        }
+
+@router.get("/cascada/estadisticas")
+async def estadisticas_cascada():
+    """Tiempos y tasas de rechazo por etapa, con el orden sugerido"""
+    return cascada.resumen()
+
+@router.delete("/cascada/estadisticas")
+async def reiniciar_estadisticas_cascada():
+    cascada.reiniciar()
+    return {"message": "Estadísticas de la cascada reiniciadas"}
@@ -1,9 +1,10 @@
-import requests
 import math
-import tempfile
-import os
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Union
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.cliente_ocr import servicio_ocr
+from filtros.cache_ocr import cache_ocr
+from filtros.ejecutor import ejecutor
+from filtros.subida import leer_imagen
 
 router = APIRouter()
 
@@ -35,25 +36,31 @@ PLANTILLA_ALTERNATIVA = [
     {"WordText": "Codigo", "Left": 101, "Top": 1207, "peso": 1.3}
 ]
 
-OCR_API_KEY = "e0b0a3ad7d88957"
+async def ocr_api(imagen: Union[str, bytes]) -> Dict:
+    """Llama a la API de OCR.space para extraer texto de la imagen (bytes o ruta)"""
+    if isinstance(imagen, (bytes, bytearray)):
+        return await ocr_api_bytes(bytes(imagen))
+    try:
+        with open(imagen, 'rb') as f:
+            contenido = f.read()
+    except Exception as e:
+        print(f"Error en OCR API: {e}")
+        return {}
+    return await ocr_api_bytes(contenido)
 
-def ocr_api(file_path: str) -> Dict:
-    """Llama a la API de OCR.space para extraer texto de la imagen"""
+async def ocr_api_bytes(imagen_bytes: bytes) -> Dict:
+    """Igual que ocr_api pero con la imagen ya en memoria"""
     try:
-        with open(file_path, 'rb') as f:
-            response = requests.post(
-                "https://api.ocr.space/parse/image",
-                data={
-                    'apikey': OCR_API_KEY,
-                    'language': 'spa',
-                    'isOverlayRequired': 'true',
-                    'scale': 'true',  # Mejora la detección
-                    'OCREngine': '2'  # Motor más preciso
-                },
-                files={'file': f},
-                timeout=30
-            )
-        return response.json() if response.status_code == 200 else {}
+        status_code, datos = await servicio_ocr.consultar(
+            ('imagen.jpg', imagen_bytes, 'image/jpeg'),
+            {
+                'language': 'spa',
+                'isOverlayRequired': 'true',
+                'scale': 'true',  # Mejora la detección
+                'OCREngine': '2'  # Motor más preciso
+            }
+        )
+        return datos if status_code == 200 else {}
     except Exception as e:
         print(f"Error en OCR API: {e}")
         return {}
@@ -211,116 +218,83 @@ def calcular_similitud(plantilla: List[Dict], palabras_ocr: List[Dict]) -> Tuple
     porcentaje = (coincidencias / peso_total) * 100
     return round(porcentaje, 2), detalles
 
+def evaluar_claves(data_ocr: Dict) -> Dict:
+    """Compara las palabras del resultado OCR con las plantillas Plin/Interbank"""
+    if not data_ocr or 'ParsedResults' not in data_ocr:
+        raise HTTPException(500, "❌ Error al procesar OCR - No se pudo extraer texto")
+    
+    # Verificar si hay errores en el OCR
+    if data_ocr.get('IsErroredOnProcessing'):
+        error_msg = data_ocr.get('ErrorMessage', 'Error desconocido')
+        raise HTTPException(500, f"❌ Error en OCR: {error_msg}")
+    
+    # Extraer palabras detectadas
+    palabras = extraer_palabras(data_ocr)
+    
+    if not palabras:
+        return {
+            "porcentaje": 0.0,
+            "advertencia": "Alterado",
+            "es_valido": False,
+            "mensaje": "⚠️ No se detectó texto en la imagen",
+            "palabras_detectadas": 0
+        }
+
+    # Comparar con ambas plantillas
+    porcentaje1, detalles1 = calcular_similitud(PLANTILLA_PLIN_INTERBANK, palabras)
+    porcentaje2, detalles2 = calcular_similitud(PLANTILLA_ALTERNATIVA, palabras)
+    
+    # Usar la mejor coincidencia
+    if porcentaje1 >= porcentaje2:
+        porcentaje = porcentaje1
+        detalles = detalles1
+        plantilla_usada = "principal"
+    else:
+        porcentaje = porcentaje2
+        detalles = detalles2
+        plantilla_usada = "alternativa"
+
+    # Clasificación de autenticidad (umbrales ajustados)
+    if porcentaje >= 85:
+        advertencia = "Auténtico"
+        es_valido = True
+    elif porcentaje >= 70:
+        advertencia = "Sospechoso"
+        es_valido = False
+    else:
+        advertencia = "Alterado"
+        es_valido = False
+
+    return {
+        "porcentaje": porcentaje,
+        "advertencia": advertencia,
+        "es_valido": es_valido,
+        "mensaje": f"{'✅' if es_valido else '⚠️'} Recibo clasificado como: {advertencia}",
+        "plantilla_usada": plantilla_usada,
+        "palabras_detectadas": len(palabras),
+        "palabras_clave_encontradas": sum(1 for d in detalles.values() if d['encontrado']),
+        "detalles_coincidencias": detalles
+    }
+
+@router.get("/ocr/cache")
+async def estadisticas_cache_ocr():
+    """Aciertos y fallos de la caché de resultados OCR"""
+    return cache_ocr.estadisticas()
+
 @router.post("/ocr")
 async def procesar_imagen(file: UploadFile = File(...)):
     """
     Endpoint para procesar imagen y verificar autenticidad mediante OCR
     """
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(400, "❌ Debe ser una imagen válida (JPG, PNG, etc.)")
-
-    temp_path = None
     try:
-        content = await file.read()
-        
-        if len(content) == 0:
-            raise HTTPException(422, "❌ El archivo está vacío")
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp:
-            temp.write(content)
-            temp_path = temp.name
+        content = (await leer_imagen(file)).contenido
         
         # Llamar al OCR
-        data_ocr = ocr_api(temp_path)
-        
-        if not data_ocr or 'ParsedResults' not in data_ocr:
-            raise HTTPException(500, "❌ Error al procesar OCR - No se pudo extraer texto")
-        
-        # Verificar si hay errores en el OCR
-        if data_ocr.get('IsErroredOnProcessing'):
-            error_msg = data_ocr.get('ErrorMessage', 'Error desconocido')
-            raise HTTPException(500, f"❌ Error en OCR: {error_msg}")
-        
-        # Extraer palabras detectadas
-        palabras = extraer_palabras(data_ocr)
-        
-        if not palabras:
-            return {
-                "porcentaje": 0.0,
-                "advertencia": "Alterado",
-                "es_valido": False,
-                "mensaje": "⚠️ No se detectó texto en la imagen",
-                "palabras_detectadas": 0
-            }
-
-        # Comparar con ambas plantillas
-        porcentaje1, detalles1 = calcular_similitud(PLANTILLA_PLIN_INTERBANK, palabras)
-        porcentaje2, detalles2 = calcular_similitud(PLANTILLA_ALTERNATIVA, palabras)
-        
-        # Usar la mejor coincidencia
-        if porcentaje1 >= porcentaje2:
-            porcentaje = porcentaje1
-            detalles = detalles1
-            plantilla_usada = "principal"
-        else:
-            porcentaje = porcentaje2
-            detalles = detalles2
-            plantilla_usada = "alternativa"
-
-        # Clasificación de autenticidad (umbrales ajustados)
-        if porcentaje >= 85:
-            advertencia = "Auténtico"
-            es_valido = True
-        elif porcentaje >= 70:
-            advertencia = "Sospechoso"
-            es_valido = False
-        else:
-            advertencia = "Alterado"
-            es_valido = False
-
-        return {
-            "porcentaje": porcentaje,
-            "advertencia": advertencia,
-            "es_valido": es_valido,
-            "mensaje": f"{'✅' if es_valido else '⚠️'} Recibo clasificado como: {advertencia}",
-            "plantilla_usada": plantilla_usada,
-            "palabras_detectadas": len(palabras),
-            "palabras_clave_encontradas": sum(1 for d in detalles.values() if d['encontrado']),
-            "detalles_coincidencias": detalles
-        }
+        data_ocr = await ocr_api(content)
+        return await ejecutor.ejecutar(evaluar_claves, data_ocr)
 
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error inesperado: {e}")
         raise HTTPException(500, f"❌ Error procesando imagen: {str(e)}")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except Exception:
-                pass
-
-    """
-    Endpoint de debug que muestra todas las palabras detectadas
-    """
-    temp_path = None
-    try:
-        content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp:
-            temp.write(content)
-            temp_path = temp.name
-        
-        data_ocr = ocr_api(temp_path)
-        palabras = extraer_palabras(data_ocr)
-        
-        return {
-            "total_palabras": len(palabras),
-            "palabras_detectadas": palabras,
-            "texto_completo": data_ocr.get('ParsedResults', [{}])[0].get('ParsedText', ''),
-            "ocr_raw": data_ocr
-        }
-    
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
\ No newline at end of file
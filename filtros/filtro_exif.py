@@ -4,6 +4,9 @@ from PIL import Image
 from PIL.ExifTags import TAGS
 import io
 import piexif
+from filtros.ejecutor import ejecutor
+from filtros.subida import leer_imagen
+from filtros.metricas import cronometrar
 
 router = APIRouter()
 
@@ -17,6 +20,7 @@ def _convert_gps_to_decimal(coord, ref):
     except Exception:
         return None
 
+@cronometrar("exif")
 def extraer_exif(imagen_bytes: bytes):
     try:
         imagen = Image.open(io.BytesIO(imagen_bytes))
@@ -111,26 +115,9 @@ def extraer_exif(imagen_bytes: bytes):
 @router.post("/filtro_exif")
 async def filtro_exif(file: UploadFile = File(...)):
     try:
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(
-                status_code=422, 
-                detail="El archivo debe ser una imagen válida"
-            )
+        content = (await leer_imagen(file)).contenido
 
-        if file.size and file.size > 10 * 1024 * 1024:
-            raise HTTPException(
-                status_code=413, 
-                detail="El archivo es demasiado grande (máximo 10MB)"
-            )
-
-        content = await file.read()
-        if not content:
-            raise HTTPException(
-                status_code=422, 
-                detail="El archivo está vacío"
-            )
-
-        resultado, mensaje = extraer_exif(content)
+        resultado, mensaje = await ejecutor.ejecutar(extraer_exif, content)
 
         if resultado is None:
             raise HTTPException(status_code=500, detail=mensaje)
@@ -1,16 +1,34 @@
 import cv2
 import numpy as np
 import os
-import tempfile
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 from fastapi import APIRouter, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
 from enum import Enum
+from filtros.registro_plantillas import RegistroPlantillas
+from filtros.perfiles_logo import AlmacenPerfilesLogo, hash_archivo
+from filtros.recibo import cargar_imagen, normalizar_ancho
+from filtros.ejecutor import ejecutor
+from filtros.subida import leer_imagen
+from filtros.metricas import cronometrar
 
 router = APIRouter()
 
 LOGO_PLIN_PATH = "./filtros/logo.jpg"
 PLANTILLAS_DIR = "./filtros/plantillas"
+# Las distancias logo-bordes se miden en píxeles: recibo y plantillas se llevan
+# siempre a este ancho (también ampliando) para que sean comparables entre
+# dispositivos. 500 px reproduce el antiguo factor 0.6 sobre capturas de 833 px.
+ANCHO_LOGO = int(os.getenv("ANCHO_LOGO", "500"))
+ESCALAS_LOGO = np.linspace(0.3, 2.0, 30)[::-1]
+# "piramide" (gruesa-a-fina) o "completo" (las 30 escalas a resolución completa)
+MODO_BUSQUEDA_LOGO = os.getenv("LOGO_MODO_BUSQUEDA", "piramide")
+
+# Hash de cada plantilla (solo se recalcula si cambia su mtime)
+registro_hash_plantillas = RegistroPlantillas(PLANTILLAS_DIR, hash_archivo)
+# Imagen de cada logo, leída una vez (y de nuevo solo si cambia en disco)
+registro_logos = RegistroPlantillas(os.path.dirname(LOGO_PLIN_PATH), cv2.imread)
+almacen_perfiles = AlmacenPerfilesLogo()
 
 class TipoLogo(str, Enum):
     PLIN = "plin"
@@ -39,53 +57,125 @@ def detectar_cuadro_blanco(imagen: np.ndarray) -> Tuple[np.ndarray, Optional[Tup
     
     return imagen, cuadro_blanco_box
 
+def _coincidencia_en_escala(
+    img_gray: np.ndarray,
+    logo_gray: np.ndarray,
+    escala: float
+) -> Optional[Tuple[float, Tuple[int, int], Tuple[int, int]]]:
+    """matchTemplate del logo reescalado; devuelve (confianza, top_left, (ancho, alto))"""
+    ancho_nuevo = int(logo_gray.shape[1] * escala)
+    alto_nuevo = int(logo_gray.shape[0] * escala)
+    if ancho_nuevo < 10 or alto_nuevo < 10:
+        return None
+    if img_gray.shape[0] < alto_nuevo or img_gray.shape[1] < ancho_nuevo:
+        return None
+    logo_redimensionado = cv2.resize(
+        logo_gray,
+        (ancho_nuevo, alto_nuevo),
+        interpolation=cv2.INTER_AREA
+    )
+    resultado = cv2.matchTemplate(
+        img_gray,
+        logo_redimensionado,
+        cv2.TM_CCOEFF_NORMED
+    )
+    _, max_val, _, max_loc = cv2.minMaxLoc(resultado)
+    return max_val, max_loc, (ancho_nuevo, alto_nuevo)
+
+def _busqueda_completa(
+    img_gray: np.ndarray,
+    logo_gray: np.ndarray
+) -> Tuple[float, Optional[Tuple[int, int, int, int]]]:
+    mejor_confianza = 0
+    mejor_box = None
+    for escala in ESCALAS_LOGO:
+        coincidencia = _coincidencia_en_escala(img_gray, logo_gray, escala)
+        if coincidencia is None:
+            continue
+        max_val, (x, y), (w, h) = coincidencia
+        if max_val > mejor_confianza:
+            mejor_confianza = max_val
+            mejor_box = (x, y, w, h)
+    return mejor_confianza, mejor_box
+
+def _busqueda_piramidal(
+    img_gray: np.ndarray,
+    logo_gray: np.ndarray,
+    factor: float = 0.5,
+    paso_grueso: int = 3,
+    candidatos: int = 3
+) -> Tuple[float, Optional[Tuple[int, int, int, int]]]:
+    """
+    Búsqueda gruesa-a-fina: primero una de cada `paso_grueso` escalas sobre la
+    imagen reducida por `factor`; luego las escalas vecinas de los mejores
+    candidatos, a resolución completa y solo dentro de una ventana alrededor
+    de cada uno. Recorre las mismas escalas que la búsqueda completa.
+    """
+    img_reducida = cv2.resize(img_gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    indices_gruesos = list(range(0, len(ESCALAS_LOGO), paso_grueso))
+    if indices_gruesos[-1] != len(ESCALAS_LOGO) - 1:
+        indices_gruesos.append(len(ESCALAS_LOGO) - 1)
+
+    gruesos = []
+    for indice in indices_gruesos:
+        coincidencia = _coincidencia_en_escala(img_reducida, logo_gray, ESCALAS_LOGO[indice] * factor)
+        if coincidencia is None:
+            continue
+        max_val, (x, y), (w, h) = coincidencia
+        centro = ((x + w / 2) / factor, (y + h / 2) / factor)
+        gruesos.append((max_val, indice, centro))
+
+    if not gruesos:
+        # Logo demasiado pequeño para la imagen reducida
+        return _busqueda_completa(img_gray, logo_gray)
+
+    mejor_confianza = 0
+    mejor_box = None
+    alto_img, ancho_img = img_gray.shape[:2]
+    for _, indice, (cx, cy) in sorted(gruesos, reverse=True)[:candidatos]:
+        vecinos = range(max(0, indice - paso_grueso + 1), min(len(ESCALAS_LOGO), indice + paso_grueso))
+        ancho_max = int(logo_gray.shape[1] * max(ESCALAS_LOGO[i] for i in vecinos))
+        alto_max = int(logo_gray.shape[0] * max(ESCALAS_LOGO[i] for i in vecinos))
+        margen = max(4, int(0.15 * max(ancho_max, alto_max)), int(2 / factor))
+        x0 = max(0, int(cx - ancho_max / 2 - margen))
+        y0 = max(0, int(cy - alto_max / 2 - margen))
+        x1 = min(ancho_img, int(cx + ancho_max / 2 + margen) + 1)
+        y1 = min(alto_img, int(cy + alto_max / 2 + margen) + 1)
+        ventana = img_gray[y0:y1, x0:x1]
+        for i in vecinos:
+            coincidencia = _coincidencia_en_escala(ventana, logo_gray, ESCALAS_LOGO[i])
+            if coincidencia is None:
+                continue
+            max_val, (x, y), (w, h) = coincidencia
+            if max_val > mejor_confianza:
+                mejor_confianza = max_val
+                mejor_box = (x0 + x, y0 + y, w, h)
+    return mejor_confianza, mejor_box
+
+@cronometrar("plantilla_logo")
 def detectar_logo_multiescala(
     imagen: np.ndarray,
     logo: np.ndarray,
-    umbral: float = 0.65
+    umbral: float = 0.65,
+    modo: str = MODO_BUSQUEDA_LOGO
 ) -> Tuple[np.ndarray, Optional[Tuple[int, int, int, int]], float]:
+    """
+    modo="completo": matchTemplate a resolución completa en las 30 escalas.
+    modo="piramide": búsqueda gruesa-a-fina con el mismo contrato de salida.
+    """
     if imagen is None or logo is None:
         return imagen, None, 0.0
     
     img_gray = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
     logo_gray = cv2.cvtColor(logo, cv2.COLOR_BGR2GRAY)
-    
-    mejor_confianza = 0
-    mejor_top_left = None
-    mejor_bottom_right = None
-    mejor_escala = 1.0
 
-    for escala in np.linspace(0.3, 2.0, 30)[::-1]:
-        ancho_nuevo = int(logo_gray.shape[1] * escala)
-        alto_nuevo = int(logo_gray.shape[0] * escala)
-        if ancho_nuevo < 10 or alto_nuevo < 10:
-            continue
-        logo_redimensionado = cv2.resize(
-            logo_gray,
-            (ancho_nuevo, alto_nuevo),
-            interpolation=cv2.INTER_AREA
-        )
-        if (img_gray.shape[0] < logo_redimensionado.shape[0] or 
-            img_gray.shape[1] < logo_redimensionado.shape[1]):
-            continue
-        resultado = cv2.matchTemplate(
-            img_gray,
-            logo_redimensionado,
-            cv2.TM_CCOEFF_NORMED
-        )
-        _, max_val, _, max_loc = cv2.minMaxLoc(resultado)
-        
-        if max_val > mejor_confianza:
-            mejor_confianza = max_val
-            mejor_top_left = max_loc
-            mejor_bottom_right = (max_loc[0] + ancho_nuevo, max_loc[1] + alto_nuevo)
-            mejor_escala = escala
+    if modo == "piramide":
+        mejor_confianza, mejor_box = _busqueda_piramidal(img_gray, logo_gray)
+    else:
+        mejor_confianza, mejor_box = _busqueda_completa(img_gray, logo_gray)
     
-    if mejor_confianza >= umbral and mejor_top_left and mejor_bottom_right:
-        x, y = mejor_top_left
-        w = mejor_bottom_right[0] - x
-        h = mejor_bottom_right[1] - y
-        return imagen, (x, y, w, h), mejor_confianza
+    if mejor_confianza >= umbral and mejor_box:
+        return imagen, mejor_box, mejor_confianza
     
     return imagen, None, mejor_confianza
 
@@ -131,20 +221,14 @@ def calcular_distancias(
 def procesar_imagen_plantilla(
     ruta_plantilla: str,
     logo: np.ndarray,
-    factor_escala: float = 0.6
+    ancho: int = ANCHO_LOGO
 ) -> Optional[Dict[str, int]]:
     if not os.path.exists(ruta_plantilla):
         return None    
     imagen = cv2.imread(ruta_plantilla)
     if imagen is None:
         return None
-    imagen = cv2.resize(
-        imagen,
-        None,
-        fx=factor_escala,
-        fy=factor_escala,
-        interpolation=cv2.INTER_AREA
-    )
+    imagen = normalizar_ancho(imagen, ancho, ampliar=True)
     imagen, cuadro_blanco_box = detectar_cuadro_blanco(imagen)
     imagen, pos_logo, _ = detectar_logo_multiescala(imagen, logo)
     imagen, borde_recibo = remarcar_contorno_recibo(imagen)
@@ -154,6 +238,45 @@ def procesar_imagen_plantilla(
     
     return None
 
+def obtener_perfil_plantilla(
+    ruta_plantilla: str,
+    logo: np.ndarray,
+    ancho: int = ANCHO_LOGO,
+    persistir: bool = True
+) -> Optional[Dict[str, int]]:
+    """
+    Distancias de la plantilla servidas desde el almacén de perfiles;
+    solo se procesa la plantilla si su perfil aún no existe
+    """
+    if not almacen_perfiles.cargado:
+        almacen_perfiles.cargar(hash_archivo(LOGO_PLIN_PATH))
+    hash_plantilla = registro_hash_plantillas.obtener(ruta_plantilla)
+    if hash_plantilla is None:
+        return None
+    return almacen_perfiles.obtener(
+        hash_plantilla,
+        ancho,
+        os.path.basename(ruta_plantilla),
+        lambda: procesar_imagen_plantilla(ruta_plantilla, logo, ancho),
+        persistir=persistir
+    )
+
+def precargar_perfiles_logo(ancho: int = ANCHO_LOGO, reconstruir: bool = False) -> int:
+    """Calcula los perfiles que falten (o todos si reconstruir=True) y los guarda"""
+    almacen_perfiles.cargar(hash_archivo(LOGO_PLIN_PATH))
+    if reconstruir:
+        almacen_perfiles.limpiar()
+    logo = registro_logos.obtener(LOGO_PLIN_PATH)
+    if logo is None:
+        print(f"⚠️  No se encontró el logo: {LOGO_PLIN_PATH}")
+        return 0
+    total = 0
+    for ruta_plantilla in obtener_plantillas_plin():
+        if obtener_perfil_plantilla(ruta_plantilla, logo, ancho, persistir=False):
+            total += 1
+    almacen_perfiles.guardar_si_cambio()
+    return total
+
 def calcular_porcentaje_cambio(
     distancias_nueva: Dict[str, int],
     distancias_plantilla: Dict[str, int]
@@ -214,165 +337,146 @@ def clasificar_autenticidad(porcentaje_cambio: float) -> str:
     else:
         return "Alterado"
 
-@router.post("/filtro_logo")
-async def filtro_logo(
-    file: UploadFile = File(...),
-    tipo_logo: TipoLogo = TipoLogo.PLIN
-):
-    temp_path = None    
-    try:
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(
-                status_code=422,
-                detail="❌ El archivo debe ser una imagen válida"
-            )
-        archivos_faltantes = []
-        logos_a_usar = []
-        
-        if tipo_logo in [TipoLogo.PLIN, TipoLogo.AMBOS]:
-            if os.path.exists(LOGO_PLIN_PATH):
-                logos_a_usar.append(("Plin", LOGO_PLIN_PATH))
-            else:
-                archivos_faltantes.append(f"Logo Plin: {LOGO_PLIN_PATH}")
-        
-        if not logos_a_usar:
-            raise HTTPException(
-                status_code=500,
-                detail=f"❌ No se encontraron logos. Faltantes: {', '.join(archivos_faltantes)}"
-            )
-        plantillas = obtener_plantillas_plin()
-        
-        if not plantillas:
-            raise HTTPException(
-                status_code=500,
-                detail=f"❌ No se encontraron plantillas en el directorio: {PLANTILLAS_DIR}. "
-                       f"Verifica que la carpeta exista y contenga imágenes (jpg, png, bmp)."
-            )
-        content = await file.read()
+def analizar_logo(imagen: Union[bytes, np.ndarray], tipo_logo: TipoLogo = TipoLogo.PLIN) -> Dict:
+    """
+    Ejecuta el análisis de logo sobre los bytes subidos o una imagen BGR ya
+    decodificada. Lanza HTTPException con el mismo detalle que /filtro_logo.
+    """
+    imagen = cargar_imagen(imagen, ancho_minimo=ANCHO_LOGO)
+    if imagen is None:
+        raise HTTPException(
+            status_code=422,
+            detail="❌ No se pudo decodificar la imagen"
+        )
+    archivos_faltantes = []
+    logos_a_usar = []
+    
+    if tipo_logo in [TipoLogo.PLIN, TipoLogo.AMBOS]:
+        if os.path.exists(LOGO_PLIN_PATH):
+            logos_a_usar.append(("Plin", LOGO_PLIN_PATH))
+        else:
+            archivos_faltantes.append(f"Logo Plin: {LOGO_PLIN_PATH}")
+    
+    if not logos_a_usar:
+        raise HTTPException(
+            status_code=500,
+            detail=f"❌ No se encontraron logos. Faltantes: {', '.join(archivos_faltantes)}"
+        )
+    plantillas = obtener_plantillas_plin()
+    
+    if not plantillas:
+        raise HTTPException(
+            status_code=500,
+            detail=f"❌ No se encontraron plantillas en el directorio: {PLANTILLAS_DIR}. "
+                   f"Verifica que la carpeta exista y contenga imágenes (jpg, png, bmp)."
+        )
+    imagen = normalizar_ancho(imagen, ANCHO_LOGO, ampliar=True)
+    imagen, cuadro_blanco_box = detectar_cuadro_blanco(imagen)
+    imagen, borde_recibo = remarcar_contorno_recibo(imagen)
+    
+    if not cuadro_blanco_box:
+        raise HTTPException(
+            status_code=422,
+            detail="❌ No se detectó el cuadro blanco del recibo. "
+                   "Verifica que la imagen sea clara y esté completa."
+        )
+    
+    if not borde_recibo:
+        raise HTTPException(
+            status_code=422,
+            detail="❌ No se detectó el contorno del recibo"
+        )
+    resultados_logos = []
+    
+    for nombre_logo, ruta_logo in logos_a_usar:
+        logo = registro_logos.obtener(ruta_logo)
+        if logo is None:
+            continue
         
-        if len(content) == 0:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ El archivo está vacío"
-            )
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp:
-            temp.write(content)
-            temp_path = temp.name
+        _, pos_logo, confianza = detectar_logo_multiescala(imagen, logo, umbral=0.60)
         
-        imagen = cv2.imread(temp_path)
-        if imagen is None:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ No se pudo decodificar la imagen"
-            )
-        factor_escala = 0.6
-        imagen = cv2.resize(
-            imagen,
-            None,
-            fx=factor_escala,
-            fy=factor_escala,
-            interpolation=cv2.INTER_AREA
+        if pos_logo:
+            resultados_logos.append({
+                "tipo": nombre_logo,
+                "bounding_box": pos_logo,
+                "confianza": round(confianza * 100, 2)
+            })
+    
+    if not resultados_logos:
+        # ✅ Formato compatible con frontend cuando NO hay logo
+        return {
+            "logo_detectado": False,
+            "es_valido": False,
+            "mensaje": "❌ No se detectó ningún logo de Plin/Interbank en la imagen",
+            "sugerencia": "Verifica que la imagen sea un recibo Plin válido y esté completa"
+        }
+    mejor_logo = max(resultados_logos, key=lambda x: x["confianza"])
+    pos_logo = mejor_logo["bounding_box"]
+    
+    distancias_nueva, centro_logo, _ = calcular_distancias(
+        pos_logo,
+        borde_recibo,
+        cuadro_blanco_box
+    )
+    
+    comparaciones = []
+    logo_obj = registro_logos.obtener(logos_a_usar[0][1])
+    
+    for idx, plantilla_path in enumerate(plantillas, 1):
+        distancias_plantilla = obtener_perfil_plantilla(
+            plantilla_path,
+            logo_obj,
+            ANCHO_LOGO
         )
-        imagen, cuadro_blanco_box = detectar_cuadro_blanco(imagen)
-        imagen, borde_recibo = remarcar_contorno_recibo(imagen)
         
-        if not cuadro_blanco_box:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ No se detectó el cuadro blanco del recibo. "
-                       "Verifica que la imagen sea clara y esté completa."
+        if distancias_plantilla:
+            porcentaje, detalles = calcular_porcentaje_cambio(
+                distancias_nueva,
+                distancias_plantilla
             )
-        
-        if not borde_recibo:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ No se detectó el contorno del recibo"
-            )
-        resultados_logos = []
-        
-        for nombre_logo, ruta_logo in logos_a_usar:
-            logo = cv2.imread(ruta_logo)
-            if logo is None:
-                continue
             
-            _, pos_logo, confianza = detectar_logo_multiescala(imagen, logo, umbral=0.60)
-            
-            if pos_logo:
-                resultados_logos.append({
-                    "tipo": nombre_logo,
-                    "bounding_box": pos_logo,
-                    "confianza": round(confianza * 100, 2)
+            if porcentaje != float('inf'):
+                comparaciones.append({
+                    "plantilla": os.path.basename(plantilla_path),
+                    "porcentaje_cambio": round(porcentaje, 2),
+                    "detalles": detalles  # ✅ Cambiado de "detalles_comparacion" a "detalles"
                 })
-        
-        if not resultados_logos:
-            # ✅ Formato compatible con frontend cuando NO hay logo
-            return JSONResponse(
-                content={
-                    "logo_detectado": False,
-                    "es_valido": False,
-                    "mensaje": "❌ No se detectó ningún logo de Plin/Interbank en la imagen",
-                    "sugerencia": "Verifica que la imagen sea un recibo Plin válido y esté completa"
-                },
-                status_code=200
-            )
-        mejor_logo = max(resultados_logos, key=lambda x: x["confianza"])
-        pos_logo = mejor_logo["bounding_box"]
-        
-        distancias_nueva, centro_logo, _ = calcular_distancias(
-            pos_logo,
-            borde_recibo,
-            cuadro_blanco_box
+    
+    if not comparaciones:
+        raise HTTPException(
+            status_code=500,
+            detail="❌ No se pudo procesar ninguna plantilla correctamente. "
+                   "Verifica que las plantillas sean válidas."
         )
-        
-        comparaciones = []
-        logo_obj = cv2.imread(logos_a_usar[0][1])
-        
-        for idx, plantilla_path in enumerate(plantillas, 1):
-            distancias_plantilla = procesar_imagen_plantilla(
-                plantilla_path,
-                logo_obj,
-                factor_escala
-            )
-            
-            if distancias_plantilla:
-                porcentaje, detalles = calcular_porcentaje_cambio(
-                    distancias_nueva,
-                    distancias_plantilla
-                )
-                
-                if porcentaje != float('inf'):
-                    comparaciones.append({
-                        "plantilla": os.path.basename(plantilla_path),
-                        "porcentaje_cambio": round(porcentaje, 2),
-                        "detalles": detalles  # ✅ Cambiado de "detalles_comparacion" a "detalles"
-                    })
-        
-        if not comparaciones:
-            raise HTTPException(
-                status_code=500,
-                detail="❌ No se pudo procesar ninguna plantilla correctamente. "
-                       "Verifica que las plantillas sean válidas."
-            )
-        mejor_coincidencia = min(comparaciones, key=lambda x: x["porcentaje_cambio"])
-        porcentaje_minimo = mejor_coincidencia["porcentaje_cambio"]
-        advertencia = clasificar_autenticidad(porcentaje_minimo)
-        es_valido = advertencia == "Auténtico"
-        
-        # ✅ Respuesta compatible con frontend
+    mejor_coincidencia = min(comparaciones, key=lambda x: x["porcentaje_cambio"])
+    porcentaje_minimo = mejor_coincidencia["porcentaje_cambio"]
+    advertencia = clasificar_autenticidad(porcentaje_minimo)
+    es_valido = advertencia == "Auténtico"
+    
+    # ✅ Respuesta compatible con frontend
+    return {
+        "logo_detectado": True,
+        "es_valido": es_valido,
+        "tipo_logo_detectado": mejor_logo["tipo"],
+        "confianza_deteccion": mejor_logo["confianza"],
+        "porcentaje_cambio_minimo": porcentaje_minimo,
+        "advertencia": advertencia,
+        "mejor_coincidencia": mejor_coincidencia,  # ✅ Incluye "detalles" en lugar de "detalles_comparacion"
+        "todas_las_comparaciones": comparaciones[:3],
+        "total_plantillas_analizadas": len(comparaciones),
+        "mensaje": f"{'✅' if es_valido else '⚠️'} Recibo clasificado como: {advertencia}",
+        "distancias_detectadas": distancias_nueva
+    }
+
+@router.post("/filtro_logo")
+async def filtro_logo(
+    file: UploadFile = File(...),
+    tipo_logo: TipoLogo = TipoLogo.PLIN
+):
+    try:
+        content = (await leer_imagen(file)).contenido
         return JSONResponse(
-            content={
-                "logo_detectado": True,
-                "es_valido": es_valido,
-                "tipo_logo_detectado": mejor_logo["tipo"],
-                "confianza_deteccion": mejor_logo["confianza"],
-                "porcentaje_cambio_minimo": porcentaje_minimo,
-                "advertencia": advertencia,
-                "mejor_coincidencia": mejor_coincidencia,  # ✅ Incluye "detalles" en lugar de "detalles_comparacion"
-                "todas_las_comparaciones": comparaciones[:3],
-                "total_plantillas_analizadas": len(comparaciones),
-                "mensaje": f"{'✅' if es_valido else '⚠️'} Recibo clasificado como: {advertencia}",
-                "distancias_detectadas": distancias_nueva
-            },
+            content=await ejecutor.ejecutar(analizar_logo, content, tipo_logo),
             status_code=200
         )
     
@@ -383,12 +487,6 @@ async def filtro_logo(
             status_code=500,
             detail=f"❌ Error inesperado: {str(e)}"
         )
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except Exception:
-                pass
 
 @router.post("/filtro_logo/plin")
 async def filtro_logo_plin(file: UploadFile = File(...)):
@@ -0,0 +1,224 @@
+# Análisis por lotes: muchas imágenes (multipart o .zip) con resultados NDJSON en streaming
+import asyncio
+import functools
+import io
+import json
+import os
+import zipfile
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from filtros.recibo import ReciboDecodificado
+from filtros.subida import leer_con_limite, validar_imagen, SUBIDA_MAX_BYTES
+from filtros.filtro_analizar import analizar_recibo, anchos_requeridos, parsear_filtros
+from filtros.filtro_cascada import cascada as cascada_filtros
+from filtros.filtro_logo import TipoLogo
+from filtros.ejecutor import ejecutor, EJECUTOR_HILOS
+
+load_dotenv()
+
+# Imágenes del lote que se analizan a la vez
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", str(max(2, EJECUTOR_HILOS))))
+LOTE_MAX_ARCHIVOS = int(os.getenv("LOTE_MAX_ARCHIVOS", "500"))
+LOTE_MAX_BYTES_ZIP = int(os.getenv("LOTE_MAX_BYTES_ZIP", str(200 * 1024 * 1024)))
+
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+TIPOS_ZIP = ("application/zip", "application/x-zip-compressed")
+
+router = APIRouter()
+
+# Cada elemento del lote: (nombre, corrutina que lee los bytes cuando le toca)
+ElementoLote = Tuple[str, Callable[[], Awaitable[bytes]]]
+
+def es_zip(archivo: UploadFile) -> bool:
+    return (archivo.content_type in TIPOS_ZIP
+            or (archivo.filename or "").lower().endswith(".zip"))
+
+def _error_cantidad() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"❌ El lote supera el máximo de {LOTE_MAX_ARCHIVOS} imágenes"
+    )
+
+def _lector_demasiado_grande(tamano: int) -> Callable[[], Awaitable[bytes]]:
+    async def lector() -> bytes:
+        raise ValueError(f"La imagen supera el tamaño máximo ({tamano} > {SUBIDA_MAX_BYTES} bytes)")
+    return lector
+
+def elementos_zip(contenido: bytes) -> List[ElementoLote]:
+    """
+    Lista las imágenes del .zip sin descomprimirlas; cada una se extrae
+    cuando le toca ser analizada
+    """
+    try:
+        archivo_zip = zipfile.ZipFile(io.BytesIO(contenido))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=422, detail="❌ El archivo .zip está dañado")
+
+    elementos = []
+    for info in archivo_zip.infolist():
+        nombre = info.filename
+        if info.is_dir() or os.path.basename(nombre).startswith(".") or "__MACOSX" in nombre:
+            continue
+        if not nombre.lower().endswith(EXTENSIONES_IMAGEN):
+            continue
+        # Mismo límite que /analizar (también protege de zip bombs)
+        if info.file_size > SUBIDA_MAX_BYTES:
+            elementos.append((nombre, _lector_demasiado_grande(info.file_size)))
+            continue
+        elementos.append((nombre, functools.partial(ejecutor.ejecutar_en_cupo, archivo_zip.read, info)))
+    return elementos
+
+def _tomar_subida(archivo: UploadFile) -> UploadFile:
+    """
+    FastAPI cierra las subidas al volver del endpoint, antes de que se
+    consuma el StreamingResponse: el lote se queda con el archivo temporal
+    (quien lo toma debe cerrarlo)
+    """
+    propio = UploadFile(archivo.file, size=archivo.size, filename=archivo.filename, headers=archivo.headers)
+    archivo.file = io.BytesIO()
+    return propio
+
+def _lector_subida(propio: UploadFile) -> Callable[[], Awaitable[bytes]]:
+    async def lector() -> bytes:
+        try:
+            # El tipo real se comprueba por firma al analizar la imagen
+            return await leer_con_limite(propio, SUBIDA_MAX_BYTES, solo_imagenes=True)
+        finally:
+            await propio.close()
+    return lector
+
+async def cerrar_subidas(propias: List[UploadFile]):
+    # Cerrar dos veces no falla: cada lector ya cierra la suya al leerla
+    for propio in propias:
+        await propio.close()
+
+async def recolectar_elementos(files: List[UploadFile]) -> Tuple[List[ElementoLote], List[UploadFile]]:
+    """
+    Arma la lista del lote sin leer las imágenes sueltas; solo los .zip se
+    leen aquí, para listar su contenido. Las subidas sueltas se toman
+    (ver _tomar_subida) solo cuando el lote ya es válido y se devuelven
+    para que el llamador las cierre.
+    """
+    if sum(not es_zip(archivo) for archivo in files) > LOTE_MAX_ARCHIVOS:
+        raise _error_cantidad()
+    elementos: List[Optional[ElementoLote]] = []
+    sueltas: List[Tuple[int, UploadFile]] = []
+    for archivo in files:
+        if es_zip(archivo):
+            elementos.extend(elementos_zip(await leer_con_limite(archivo, LOTE_MAX_BYTES_ZIP)))
+        else:
+            sueltas.append((len(elementos), archivo))
+            elementos.append(None)
+    if not elementos:
+        raise HTTPException(status_code=422, detail="❌ El lote no contiene imágenes")
+    if len(elementos) > LOTE_MAX_ARCHIVOS:
+        raise _error_cantidad()
+
+    propias = []
+    for posicion, archivo in sueltas:
+        propio = _tomar_subida(archivo)
+        propias.append(propio)
+        elementos[posicion] = (archivo.filename, _lector_subida(propio))
+    return elementos, propias
+
+def _validar_y_decodificar(contenido: bytes, anchos: Set[int]) -> ReciboDecodificado:
+    # Firma y dimensiones antes de decodificar (también para lo extraído de un .zip)
+    return ReciboDecodificado(validar_imagen(contenido).contenido).decodificar(anchos)
+
+async def analizar_elemento(
+    indice: int,
+    nombre: str,
+    lector: Callable[[], Awaitable[bytes]],
+    tipo_logo: TipoLogo,
+    filtros: Set[str],
+    cascada: bool = False
+) -> Dict:
+    """
+    Cada imagen pasa por la admisión del ejecutor como una petición más, así
+    el lote no le quita el pool a los análisis individuales. Un error en una
+    imagen (también un 503 por saturación) se reporta en su línea y no
+    detiene el lote.
+    """
+    try:
+        with ejecutor.cupo():
+            anchos = cascada_filtros.anchos_iniciales(filtros) if cascada else anchos_requeridos(filtros)
+            contenido = await lector()
+            recibo = await ejecutor.ejecutar_en_cupo(_validar_y_decodificar, contenido, anchos)
+            if cascada:
+                resultado = await cascada_filtros.analizar(recibo, tipo_logo, filtros)
+            else:
+                resultado = await analizar_recibo(recibo, tipo_logo, filtros=filtros)
+        return {"indice": indice, "archivo": nombre, **resultado}
+    except HTTPException as e:
+        return {"indice": indice, "archivo": nombre, "es_valido": False, "error": e.detail}
+    except Exception as e:
+        return {"indice": indice, "archivo": nombre, "es_valido": False, "error": f"❌ {str(e)}"}
+
+async def analizar_lote(
+    elementos: List[ElementoLote],
+    tipo_logo: TipoLogo = TipoLogo.PLIN,
+    filtros: Optional[Set[str]] = None,
+    concurrencia: int = LOTE_CONCURRENCIA,
+    cascada: bool = False
+) -> AsyncIterator[Dict]:
+    """
+    Analiza el lote con `concurrencia` imágenes en vuelo y entrega cada
+    resultado en cuanto termina (no en el orden de entrada)
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def con_limite(indice: int, nombre: str, lector: Callable[[], Awaitable[bytes]]) -> Dict:
+        async with semaforo:
+            return await analizar_elemento(indice, nombre, lector, tipo_logo, filtros, cascada)
+
+    tareas = [
+        asyncio.create_task(con_limite(i, nombre, lector))
+        for i, (nombre, lector) in enumerate(elementos)
+    ]
+    try:
+        for completada in asyncio.as_completed(tareas):
+            yield await completada
+    finally:
+        # Si el cliente corta la conexión no seguimos analizando
+        for tarea in tareas:
+            tarea.cancel()
+
+@router.post("/analizar/lote")
+async def analizar_lote_endpoint(
+    files: List[UploadFile] = File(...),
+    tipo_logo: TipoLogo = TipoLogo.PLIN,
+    filtros: Optional[str] = None,
+    cascada: bool = False
+):
+    """
+    Recibe varias imágenes (multipart) y/o archivos .zip y devuelve una
+    línea NDJSON por imagen a medida que se completa su análisis.
+    `filtros` selecciona un subconjunto, p. ej. "plin,logo,ocr"; con
+    `cascada` cada imagen pasa por la cascada con corte temprano.
+    """
+    seleccion = parsear_filtros(filtros)
+    elementos, propias = await recolectar_elementos(files)
+
+    # Los cupos del ejecutor se toman por imagen dentro del generador: si el
+    # cliente se va antes de empezar la respuesta no queda nada reservado
+    async def generar():
+        try:
+            async for resultado in analizar_lote(elementos, tipo_logo, seleccion, cascada=cascada):
+                yield json.dumps(resultado, ensure_ascii=False, default=str) + "\n"
+        finally:
+            await cerrar_subidas(propias)
+
+    # Un generador que nunca empieza no ejecuta su finally: la tarea de fondo
+    # también cierra las subidas (Starlette la ejecuta salvo que el envío
+    # falle con error; en ese caso quedan para el recolector de basura)
+    return StreamingResponse(
+        generar(),
+        media_type="application/x-ndjson",
+        headers={"X-Lote-Total": str(len(elementos))},
+        background=BackgroundTask(cerrar_subidas, propias)
+    )
@@ -2,15 +2,15 @@
 import cv2
 import numpy as np
 import re
-import requests
+import httpx
 from datetime import datetime
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.cliente_ocr import servicio_ocr
+from filtros.subida import leer_imagen
+from filtros.ejecutor import ejecutor
 
 router = APIRouter()
 
-API_KEY = 'e0b0a3ad7d88957'
-OCR_API_URL = 'https://api.ocr.space/parse/image'
-
 DESTINOS_VALIDOS = [
     'Yape', 'Plin', 'BCP', 'Interbank', 'BBVA', 'Scotiabank',
     'Caja Arequipa', 'Caja Huancayo', 'Caja Piura', 'Caja Cusco',
@@ -18,21 +18,18 @@ DESTINOS_VALIDOS = [
     'Caja Tacna', 'Caja Metropolitana', 'Banco Pichincha'
 ]
 
-def enviar_imagen_ocr_bytes(imagen_bytes):
+async def enviar_imagen_ocr_bytes(imagen_bytes):
     """Envía la imagen al servicio OCR externo"""
     try:
-        response = requests.post(
-            OCR_API_URL,
-            files={'file': imagen_bytes},
-            data={
-                'apikey': API_KEY,
+        status_code, resultado = await servicio_ocr.consultar(
+            imagen_bytes,
+            {
                 'language': 'spa',
                 'OCREngine': '2',
-                'isOverlayRequired': True
-            },
-            timeout=30
+                'isOverlayRequired': 'True'
+            }
         )
-    except requests.Timeout:
+    except httpx.TimeoutException:
         raise HTTPException(
             status_code=504, 
             detail="❌ El OCR externo tardó demasiado (timeout)."
@@ -43,14 +40,12 @@ def enviar_imagen_ocr_bytes(imagen_bytes):
             detail=f"❌ Error llamando al OCR externo: {str(e)}"
         )
     
-    if response.status_code != 200:
+    if status_code != 200:
         raise HTTPException(
             status_code=502, 
-            detail=f"❌ OCR externo respondió mal: {response.status_code}"
+            detail=f"❌ OCR externo respondió mal: {status_code}"
         )
     
-    resultado = response.json()
-    
     if resultado.get("IsErroredOnProcessing"):
         return None, []
     
@@ -313,79 +308,77 @@ def validar_estructura_plin(texto):
     
     return resultado
 
-@router.post("/filtro_ocr")
-async def filtro_ocr_plin(file: UploadFile = File(...)):
+def evaluar_texto_plin(texto):
     """
-    Endpoint para validar comprobantes Plin mediante OCR
+    Detecta la estructura y valida el texto OCR de un comprobante Plin
     """
-    if not file.content_type or not file.content_type.startswith('image/'):
+    if not texto:
         raise HTTPException(
-            status_code=422, 
-            detail="❌ El archivo debe ser una imagen válida"
+            status_code=422,
+            detail="❌ No se pudo extraer texto del comprobante"
         )
     
+    # Detectar tipo de estructura
+    tipo = detectar_estructura(texto)
+    
+    if tipo == 0:
+        raise HTTPException(
+            status_code=422,
+            detail="❌ No se reconoce como un comprobante Plin válido. "
+                   "Verifica que la imagen sea clara y contenga '¡Pago exitoso!' o 'Enviado a:'"
+        )
+    
+    # Validar estructura
+    resultado = validar_estructura_plin(texto)
+    
+    # Agregar texto completo para debug
+    resultado["texto_ocr"] = texto
+    
+    return resultado
+
+def preparar_imagen_ocr(content: bytes) -> bytes:
+    """Decodifica, limita el tamaño y recorta el cuadro blanco antes del OCR"""
+    # Decodificar imagen
+    np_arr = np.frombuffer(content, np.uint8)
+    imagen = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+    
+    if imagen is None:
+        raise HTTPException(
+            status_code=422,
+            detail="❌ No se pudo decodificar la imagen"
+        )
+    
+    # Redimensionar si es muy grande
+    if imagen.shape[0] > 2000 or imagen.shape[1] > 2000:
+        factor = min(2000 / imagen.shape[0], 2000 / imagen.shape[1])
+        imagen = cv2.resize(imagen, (0, 0), fx=factor, fy=factor)
+    
+    # Recortar cuadro blanco
+    recorte = recortar_cuadro_blanco_np(imagen)
+    
+    if recorte is None:
+        recorte = imagen
+    
+    # Convertir a bytes para OCR
+    _, buffer = cv2.imencode(".png", recorte)
+    return buffer.tobytes()
+
+@router.post("/filtro_ocr")
+async def filtro_ocr_plin(file: UploadFile = File(...)):
+    """
+    Endpoint para validar comprobantes Plin mediante OCR
+    """
     try:
-        content = await file.read()
-        
-        if len(content) == 0:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ El archivo está vacío"
-            )
-        
-        # Decodificar imagen
-        np_arr = np.frombuffer(content, np.uint8)
-        imagen = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        content = (await leer_imagen(file)).contenido
         
-        if imagen is None:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ No se pudo decodificar la imagen"
-            )
-        
-        # Redimensionar si es muy grande
-        if imagen.shape[0] > 2000 or imagen.shape[1] > 2000:
-            factor = min(2000 / imagen.shape[0], 2000 / imagen.shape[1])
-            imagen = cv2.resize(imagen, (0, 0), fx=factor, fy=factor)
-        
-        # Recortar cuadro blanco
-        recorte = recortar_cuadro_blanco_np(imagen)
-        
-        if recorte is None:
-            recorte = imagen
-        
-        # Convertir a bytes para OCR
-        _, buffer = cv2.imencode(".png", recorte)
-        img_bytes = buffer.tobytes()
+        img_bytes = await ejecutor.ejecutar(preparar_imagen_ocr, content)
         
         # Enviar a OCR
-        texto, lineas_overlay = enviar_imagen_ocr_bytes(
+        texto, lineas_overlay = await enviar_imagen_ocr_bytes(
             ('comprobante.png', img_bytes, 'image/png')
         )
         
-        if not texto:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ No se pudo extraer texto del comprobante"
-            )
-        
-        # Detectar tipo de estructura
-        tipo = detectar_estructura(texto)
-        
-        if tipo == 0:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ No se reconoce como un comprobante Plin válido. "
-                       "Verifica que la imagen sea clara y contenga '¡Pago exitoso!' o 'Enviado a:'"
-            )
-        
-        # Validar estructura
-        resultado = validar_estructura_plin(texto)
-        
-        # Agregar texto completo para debug
-        resultado["texto_ocr"] = texto
-        
-        return resultado
+        return await ejecutor.ejecutar(evaluar_texto_plin, texto)
         
     except HTTPException:
         raise
@@ -1,14 +1,148 @@
 import cv2
+import json
 import numpy as np
 import os
-import glob
-import tempfile
-from typing import List, Tuple, Optional
+from typing import Any, Dict, List, NamedTuple, Tuple, Optional
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.registro_plantillas import RegistroPlantillas
+from filtros.recibo import cargar_imagen, normalizar_ancho, ANCHO_CANONICO
+from filtros.ejecutor import ejecutor
+from filtros.metricas import medir
+from filtros.emparejadores import emparejador
+from filtros.subida import leer_imagen
 
 router = APIRouter()
 
-def alinear_imagen(sospechosa_gray: np.ndarray, plantilla_gray: np.ndarray) -> Tuple[np.ndarray, int]:
+PLANTILLAS_DIR = "./filtros/plantillas/"
+# Recalibrado al ancho canónico: con 1/2 de los píxeles, 500 puntos dan la misma similitud
+ORB_NFEATURES = int(os.getenv("PIXELES_ORB_NFEATURES", "500" if ANCHO_CANONICO else "1000"))
+# Reparto de los puntos en una rejilla "filasxcolumnas" (vacío = desactivado):
+# evita que el texto denso acapare los puntos y deje zonas sin alinear
+ORB_REJILLA = os.getenv("PIXELES_ORB_REJILLA", "")
+# Con rejilla se detectan más candidatos y se eligen los mejores de cada celda
+ORB_SOBREMUESTREO = 4
+# Umbrales de porcentaje_coincidencia: <= ALTERADO es Alterado, > AUTENTICO es Auténtico
+PIXELES_UMBRAL_ALTERADO = 85
+PIXELES_UMBRAL_AUTENTICO = 98
+# Plantillas (las más parecidas según el descriptor global) que se alinean y comparan
+PIXELES_TOP_K = int(os.getenv("PIXELES_TOP_K", "3"))
+# Campos críticos como fracciones de la plantilla (x0, y0, x1, y1), medidos sobre
+# plin.jpg. Otra plantilla puede definir los suyos en "<nombre>.regiones.json"
+REGIONES_PLIN = {
+    "monto": (0.12, 0.255, 0.88, 0.305),
+    "nombre": (0.10, 0.412, 0.90, 0.443),
+    "telefono": (0.10, 0.445, 0.90, 0.476),
+    "fecha": (0.10, 0.700, 0.90, 0.732),
+    "codigo": (0.10, 0.781, 0.90, 0.814),
+}
+# Celdas (filas, columnas) para localizar cambios también fuera de los campos
+REJILLA_DIFERENCIAS = (16, 4)
+# % de píxeles distintos dentro de una región: una captura limpia queda por
+# debajo de 3.5 (8 si se recomprimió varias veces); cambiar el monto da ~20
+PIXELES_REGION_SOSPECHOSO = float(os.getenv("PIXELES_REGION_SOSPECHOSO", "5"))
+PIXELES_REGION_ALTERADO = float(os.getenv("PIXELES_REGION_ALTERADO", "12"))
+PIXELES_MAX_ANOMALIAS = 3
+# Miniatura del descriptor global (ancho x alto): conserva la disposición de
+# bloques (cabecera, monto, botones) y no depende del ancho de la captura
+DESCRIPTOR_TAMANO = (24, 48)
+
+class CaracteristicasORB(NamedTuple):
+    puntos: np.ndarray  # (N, 2) float32
+    descriptores: Optional[np.ndarray]
+    indice: Any = None  # índice del emparejador (solo plantillas)
+
+class PlantillaPixeles(NamedTuple):
+    gris: np.ndarray
+    caracteristicas: CaracteristicasORB
+    descriptor_global: np.ndarray
+    regiones: Dict[str, Tuple[float, float, float, float]]
+
+def cargar_regiones(ruta: str) -> Dict[str, Tuple[float, float, float, float]]:
+    """Regiones de la plantilla desde "<nombre>.regiones.json"; si no existe, las de Plin"""
+    ruta_regiones = os.path.splitext(ruta)[0] + ".regiones.json"
+    if not os.path.exists(ruta_regiones):
+        return REGIONES_PLIN
+    try:
+        with open(ruta_regiones, "r", encoding="utf-8") as f:
+            return {nombre: tuple(float(v) for v in caja) for nombre, caja in json.load(f).items()}
+    except (OSError, ValueError, TypeError) as e:
+        print(f"⚠️ Regiones inválidas en {ruta_regiones}: {e}")
+        return REGIONES_PLIN
+
+def parsear_rejilla(valor: str) -> Optional[Tuple[int, int]]:
+    """Convierte "4x8" en (4, 8); vacío o inválido -> None"""
+    try:
+        filas, columnas = (int(v) for v in valor.lower().split("x"))
+    except ValueError:
+        return None
+    return (filas, columnas) if filas > 0 and columnas > 0 else None
+
+def repartir_en_rejilla(keypoints: tuple, forma: Tuple[int, ...], maximo: int, rejilla: Tuple[int, int]) -> list:
+    """Los `maximo` puntos más fuertes con el mismo cupo por celda"""
+    if not keypoints:
+        return list(keypoints)
+    filas, columnas = rejilla
+    alto, ancho = forma[:2]
+    puntos = cv2.KeyPoint_convert(keypoints)
+    respuesta = np.fromiter((k.response for k in keypoints), np.float32, len(keypoints))
+    celda = (
+        np.minimum((puntos[:, 1] * filas / alto).astype(int), filas - 1) * columnas
+        + np.minimum((puntos[:, 0] * columnas / ancho).astype(int), columnas - 1)
+    )
+    # Por celda y, dentro de cada celda, de mayor a menor respuesta
+    orden = np.lexsort((-respuesta, celda))
+    celdas = celda[orden]
+    posicion = np.arange(len(orden)) - np.searchsorted(celdas, celdas)
+    elegidos = orden[posicion < -(-maximo // (filas * columnas))]
+    elegidos = elegidos[np.argsort(-respuesta[elegidos], kind="stable")[:maximo]]
+    return [keypoints[i] for i in elegidos]
+
+def detectar_caracteristicas(
+    gris: np.ndarray,
+    nfeatures: int = ORB_NFEATURES,
+    rejilla: Optional[Tuple[int, int]] = parsear_rejilla(ORB_REJILLA)
+) -> CaracteristicasORB:
+    # Una máscara de unos (no de 255) se anula al reducirla en la pirámide: solo
+    # quedan los puntos de la escala original. Los umbrales se calibraron así.
+    mascara = np.ones(gris.shape, dtype=np.uint8)
+    with medir("orb_deteccion"):
+        if rejilla is None:
+            orb = cv2.ORB.create(nfeatures=nfeatures)
+            kp, des = orb.detectAndCompute(gris, mascara)
+        else:
+            orb = cv2.ORB.create(nfeatures=nfeatures * ORB_SOBREMUESTREO)
+            kp = repartir_en_rejilla(orb.detect(gris, mascara), gris.shape, nfeatures, rejilla)
+            kp, des = orb.compute(gris, kp)
+    return CaracteristicasORB(cv2.KeyPoint_convert(kp).reshape(-1, 2), des)
+
+def descriptor_global(gris: np.ndarray) -> np.ndarray:
+    """
+    Miniatura centrada y de norma 1: el producto escalar entre dos
+    descriptores es la correlación de las miniaturas (1 = mismo diseño)
+    """
+    miniatura = cv2.resize(gris, DESCRIPTOR_TAMANO, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    miniatura -= miniatura.mean()
+    norma = np.linalg.norm(miniatura)
+    return miniatura / norma if norma > 0 else miniatura
+
+def cargar_plantilla_pixeles(ruta: str) -> Optional[PlantillaPixeles]:
+    """Lee la plantilla en gris y calcula sus características ORB una sola vez"""
+    plantilla = cv2.imread(ruta, cv2.IMREAD_GRAYSCALE)
+    if plantilla is None:
+        return None
+    plantilla = normalizar_ancho(plantilla)
+    caracteristicas = detectar_caracteristicas(plantilla)
+    if caracteristicas.descriptores is not None and len(caracteristicas.descriptores) >= 2:
+        caracteristicas = caracteristicas._replace(indice=emparejador.indexar(caracteristicas.descriptores))
+    return PlantillaPixeles(plantilla, caracteristicas, descriptor_global(plantilla), cargar_regiones(ruta))
+
+registro_pixeles = RegistroPlantillas(PLANTILLAS_DIR, cargar_plantilla_pixeles)
+
+def alinear_imagen(
+    sospechosa_gray: np.ndarray,
+    plantilla_gray: np.ndarray,
+    caracteristicas_plantilla: Optional[CaracteristicasORB] = None
+) -> Tuple[np.ndarray, int]:
     if sospechosa_gray is None or plantilla_gray is None:
         raise ValueError("Una o ambas imágenes están vacías")
     if sospechosa_gray.shape[0] < 50 or sospechosa_gray.shape[1] < 50:
@@ -18,40 +152,36 @@ def alinear_imagen(sospechosa_gray: np.ndarray, plantilla_gray: np.ndarray) -> T
     if sospechosa_gray.shape == plantilla_gray.shape:
         if np.array_equal(sospechosa_gray, plantilla_gray):
             return sospechosa_gray, 1000    
-    orb = cv2.ORB.create(nfeatures=1000)
-    mask1 = np.ones(plantilla_gray.shape, dtype=np.uint8)
-    mask2 = np.ones(sospechosa_gray.shape, dtype=np.uint8)
-    kp1, des1 = orb.detectAndCompute(plantilla_gray, mask1)
-    kp2, des2 = orb.detectAndCompute(sospechosa_gray, mask2)
+    plantilla_orb = caracteristicas_plantilla or detectar_caracteristicas(plantilla_gray)
+    sospechosa_orb = detectar_caracteristicas(sospechosa_gray)
+    des1, des2 = plantilla_orb.descriptores, sospechosa_orb.descriptores
     if des1 is None or des2 is None:
         raise ValueError("No se pudieron extraer características de una o ambas imágenes")    
     if len(des1) < 10 or len(des2) < 10:
         raise ValueError(f"Muy pocas características detectadas: plantilla={len(des1) if des1 is not None else 0}, sospechosa={len(des2) if des2 is not None else 0}")
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
-    matches = bf.knnMatch(des1, des2, k=2)
-    buenos = []
-    for match_pair in matches:
-        if len(match_pair) == 2:
-            m, n = match_pair
-            if m.distance < 0.75 * n.distance:
-                buenos.append(m)    
-    if len(buenos) < 4:
-        raise ValueError(f"Pocos matches buenos: {len(buenos)}. Características detectadas: plantilla={len(des1)}, sospechosa={len(des2)}")
-    src_pts = np.array([[kp1[m.queryIdx].pt[0], kp1[m.queryIdx].pt[1]] for m in buenos], dtype=np.float32).reshape(-1,1,2)
-    dst_pts = np.array([[kp2[m.trainIdx].pt[0], kp2[m.trainIdx].pt[1]] for m in buenos], dtype=np.float32).reshape(-1,1,2)
-    H, _ = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, 5.0)
-    if H is None:
-        raise ValueError("No se pudo calcular la homografía")
-    h, w = plantilla_gray.shape
-    alineada = cv2.warpPerspective(sospechosa_gray, H, (w, h))
-    return alineada, len(buenos)
+    indice = plantilla_orb.indice if plantilla_orb.indice is not None else emparejador.indexar(des1)
+    with medir("orb_match"):
+        # Cada punto de la sospechosa busca sus 2 vecinos en el índice de la plantilla
+        en_plantilla, en_sospechosa = emparejador.emparejar(indice, des2)
+    if len(en_plantilla) < 4:
+        raise ValueError(f"Pocos matches buenos: {len(en_plantilla)}. Características detectadas: plantilla={len(des1)}, sospechosa={len(des2)}")
+    src_pts = plantilla_orb.puntos[en_plantilla].reshape(-1, 1, 2)
+    dst_pts = sospechosa_orb.puntos[en_sospechosa].reshape(-1, 1, 2)
+    with medir("homografia"):
+        H, _ = cv2.findHomography(dst_pts, src_pts, cv2.RANSAC, 5.0)
+        if H is None:
+            raise ValueError("No se pudo calcular la homografía")
+        h, w = plantilla_gray.shape
+        alineada = cv2.warpPerspective(sospechosa_gray, H, (w, h))
+    return alineada, len(en_plantilla)
 
 def evaluar_similitud(plantilla_path: str, sospechosa_gray: np.ndarray, threshold: int = 30) -> Tuple[Optional[np.ndarray], float, int, str]:
-    plantilla = cv2.imread(plantilla_path, cv2.IMREAD_GRAYSCALE)
-    if plantilla is None:
+    entrada = registro_pixeles.obtener(plantilla_path)
+    if entrada is None:
         return None, 0.0, 0, f"❌ No se pudo cargar plantilla: {plantilla_path}"
+    plantilla = entrada.gris
     try:
-        alineada, matches = alinear_imagen(sospechosa_gray, plantilla)
+        alineada, matches = alinear_imagen(sospechosa_gray, plantilla, entrada.caracteristicas)
         diff = cv2.absdiff(plantilla, alineada)
         _, mask = cv2.threshold(diff, threshold, 255, cv2.THRESH_BINARY)
         pixeles_diferentes = int((mask > 0).sum())
@@ -62,72 +192,168 @@ def evaluar_similitud(plantilla_path: str, sospechosa_gray: np.ndarray, threshol
         print(f"DEBUG: Error en evaluar_similitud: {e}")
         return None, 0.0, 0, f"❌ Error: {e}"
 
-def detectar_diferencias(plantillas_paths: List[str], sospechosa_gray: np.ndarray, threshold: int = 30):
+def regiones_rejilla(filas: int, columnas: int) -> Dict[str, Tuple[float, float, float, float]]:
+    return {
+        f"celda_{f}_{c}": (c / columnas, f / filas, (c + 1) / columnas, (f + 1) / filas)
+        for f in range(filas) for c in range(columnas)
+    }
+
+CELDAS_DIFERENCIAS = regiones_rejilla(*REJILLA_DIFERENCIAS)
+
+def puntuar_regiones(mask: np.ndarray, regiones: Dict[str, Tuple[float, float, float, float]]) -> Dict[str, float]:
+    """
+    % de píxeles distintos en cada región. Con la imagen integral de la
+    máscara, la suma de cualquier rectángulo son 4 lecturas: todas las
+    regiones se resuelven a la vez con indexado de numpy.
+    """
+    alto, ancho = mask.shape[:2]
+    integral = cv2.integral((mask > 0).view(np.uint8))
+    cajas = np.array(list(regiones.values()), dtype=np.float64).reshape(-1, 4)
+    x0, x1 = (np.clip(np.round(cajas[:, i] * ancho), 0, ancho).astype(int) for i in (0, 2))
+    y0, y1 = (np.clip(np.round(cajas[:, i] * alto), 0, alto).astype(int) for i in (1, 3))
+    suma = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    area = np.maximum((x1 - x0) * (y1 - y0), 1)
+    return dict(zip(regiones, np.round(suma / area * 100.0, 2).tolist()))
+
+def analizar_regiones(mask: np.ndarray, regiones: Dict[str, Tuple[float, float, float, float]]) -> Dict:
+    """Puntaje por campo crítico y las zonas (campos o celdas) con más cambios"""
+    with medir("regiones_diferencia"):
+        puntajes = puntuar_regiones(mask, {**regiones, **CELDAS_DIFERENCIAS})
+    campos = {nombre: puntajes[nombre] for nombre in regiones}
+    anomalias = sorted(
+        (nombre for nombre, valor in puntajes.items() if valor > PIXELES_REGION_SOSPECHOSO),
+        key=lambda nombre: -puntajes[nombre]
+    )[:PIXELES_MAX_ANOMALIAS]
+    cajas = {**CELDAS_DIFERENCIAS, **regiones}
+    return {
+        "regiones": campos,
+        "anomalias": [
+            {"region": nombre, "porcentaje": puntajes[nombre], "caja": [round(v, 3) for v in cajas[nombre]]}
+            for nombre in anomalias
+        ],
+        "campos_criticos_limpios": all(v <= PIXELES_REGION_SOSPECHOSO for v in campos.values()),
+    }
+
+def ordenar_plantillas(plantillas_paths: List[str], sospechosa_gray: np.ndarray) -> List[Tuple[str, float]]:
+    """
+    Ordena las plantillas por la correlación de su descriptor global con
+    la imagen (una multiplicación matriz-vector para toda la biblioteca)
+    """
+    with medir("ranking_plantillas"):
+        candidatas = []
+        for ruta in plantillas_paths:
+            entrada = registro_pixeles.obtener(ruta)
+            if entrada is not None:
+                candidatas.append((ruta, entrada.descriptor_global))
+        if not candidatas:
+            return []
+        puntajes = np.stack([d for _, d in candidatas]) @ descriptor_global(sospechosa_gray)
+        orden = np.argsort(-puntajes, kind="stable")
+        return [(candidatas[i][0], float(puntajes[i])) for i in orden]
+
+def detectar_diferencias(
+    plantillas_paths: List[str],
+    sospechosa_gray: np.ndarray,
+    threshold: int = 30,
+    top_k: int = PIXELES_TOP_K
+):
+    """
+    Alinea y compara solo las top_k plantillas más parecidas, de la mejor
+    a la peor, y se detiene en la primera que ya sería "Auténtico" tanto en
+    el porcentaje global como en sus campos críticos
+    """
     resultados = []
-    for plantilla_path in plantillas_paths:
+    evaluadas = 0
+    ranking = ordenar_plantillas(plantillas_paths, sospechosa_gray)
+    for plantilla_path, _ in ranking[:max(1, top_k)]:
+        evaluadas += 1
         mask, similitud, matches, mensaje = evaluar_similitud(
             plantilla_path, sospechosa_gray, threshold
         )
         if mask is not None:
+            entrada = registro_pixeles.obtener(plantilla_path)
+            regiones = analizar_regiones(mask, entrada.regiones if entrada else REGIONES_PLIN)
+            autentica = (round(similitud, 2) > PIXELES_UMBRAL_AUTENTICO
+                         and regiones['campos_criticos_limpios'])
             resultados.append({
                 'plantilla': os.path.basename(plantilla_path),
                 'porcentaje': similitud,
                 'coincidencias': matches,
-                'mensaje': mensaje
+                'mensaje': mensaje,
+                'autentica': autentica,
+                'regiones': regiones
             })
+            if autentica:
+                break
     if not resultados:
         return None
-    mejor_resultado = max(resultados, key=lambda x: x['porcentaje'])
+    # Una plantilla que pasa también por regiones gana a otra con más % global
+    mejor_resultado = max(resultados, key=lambda x: (x['autentica'], x['porcentaje']))
     return {
         'porcentaje': round(mejor_resultado['porcentaje'], 2),
-        'coincidencias': mejor_resultado['coincidencias']
+        'coincidencias': mejor_resultado['coincidencias'],
+        'plantilla': mejor_resultado['plantilla'],
+        'plantillas_evaluadas': evaluadas,
+        **mejor_resultado['regiones']
+    }
+
+def obtener_plantillas_pixeles() -> List[str]:
+    return registro_pixeles.rutas()
+
+def evaluar_pixeles(sospechosa_gray: np.ndarray, threshold: int = 30) -> dict:
+    if sospechosa_gray is None:
+        raise Exception("❌ No se pudo decodificar la imagen subida")
+    if sospechosa_gray.size == 0:
+        raise Exception("❌ La imagen está vacía")
+    sospechosa_gray = normalizar_ancho(sospechosa_gray)
+    plantillas_paths = obtener_plantillas_pixeles()
+    if not plantillas_paths:
+        raise Exception("❌ No hay plantillas disponibles para comparar")
+    result = detectar_diferencias(plantillas_paths, sospechosa_gray, threshold)
+    if result is None:
+        raise Exception("❌ No se pudo comparar la imagen con las plantillas")
+    porcentaje = result['porcentaje']
+    advertencia = ""
+    if porcentaje <= PIXELES_UMBRAL_ALTERADO:
+        advertencia = "Alterado"
+    elif porcentaje <= PIXELES_UMBRAL_AUTENTICO:
+        advertencia = "Sospechoso"
+    else:
+        advertencia = "Auténtico"
+    # Cambiar un dígito del monto apenas mueve el porcentaje global, pero sí el de su región
+    peor_region = max(result['regiones'].values(), default=0.0)
+    if peor_region > PIXELES_REGION_ALTERADO:
+        advertencia = "Alterado"
+    elif peor_region > PIXELES_REGION_SOSPECHOSO and advertencia == "Auténtico":
+        advertencia = "Sospechoso"
+
+    return {
+        "porcentaje_coincidencia": round(porcentaje, 2),
+        "coincidencias": result['coincidencias'],
+        "plantilla": result['plantilla'],
+        "plantillas_evaluadas": result['plantillas_evaluadas'],
+        "advertencia": advertencia,
+        "regiones": result['regiones'],
+        "anomalias": result['anomalias'],
+        "campos_criticos_limpios": result['campos_criticos_limpios']
     }
 
+def evaluar_pixeles_bytes(content: bytes, threshold: int = 30) -> dict:
+    return evaluar_pixeles(cargar_imagen(content, cv2.IMREAD_GRAYSCALE, ANCHO_CANONICO), threshold)
+
 @router.post("/filtro_pixeles")
 async def filtro_pixeles(file: UploadFile = File(...)):
     try:
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=422, detail="❌ El archivo debe ser una imagen")
-
-        content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
+        content = (await leer_imagen(file)).contenido
 
         try:
-            nparr = np.frombuffer(content, np.uint8)
-            sospechosa_gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-            if sospechosa_gray is None:
-                raise Exception("❌ No se pudo decodificar la imagen subida")
-            if sospechosa_gray.size == 0:
-                raise Exception("❌ La imagen está vacía")
-            plantillas_dir = "./filtros/plantillas/"
-            extensiones = ['*.jpg', '*.jpeg', '*.png', '*.bmp']
-            plantillas_paths = []
-            for ext in extensiones:
-                plantillas_paths.extend(glob.glob(os.path.join(plantillas_dir, ext)))
-            if not plantillas_paths:
-                raise Exception("❌ No hay plantillas disponibles para comparar")
-            threshold = 30
-            result = detectar_diferencias(plantillas_paths, sospechosa_gray, threshold)
-            if result is None:
-                raise Exception("❌ No se pudo comparar la imagen con las plantillas")
-            porcentaje = result['porcentaje']
-            advertencia = ""
-            if porcentaje <= 85:
-                advertencia = "Alterado"
-            elif porcentaje <= 98:
-                advertencia = "Sospechoso"
-            else:
-                advertencia = "Auténtico"
-
-            return {
-                "porcentaje_coincidencia": round(porcentaje, 2),
-                "coincidencias": result['coincidencias'],
-                "advertencia": advertencia
-            }
+            return await ejecutor.ejecutar(evaluar_pixeles_bytes, content)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=422, detail=f"❌ Error al procesar la imagen: {e}")
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"❌ Error al leer el archivo: {e}")
\ No newline at end of file
@@ -1,17 +1,94 @@
 # Filtro Plin Calibrado
+import os
+from typing import Dict, Tuple
 import cv2
 import numpy as np
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from filtros.ejecutor import ejecutor
+from filtros.recibo import cargar_imagen, normalizar_ancho
+from filtros.metricas import cronometrar
+from filtros.subida import leer_imagen
 
 router = APIRouter()
 
 class NotPlinTransaction(Exception):
     pass
 
+# Rangos HSV optimizados (calibrados con imágenes reales): (inferior, superior) inclusivos
+RANGOS_PLIN = {
+    "turquesa": ((70, 25, 35), (110, 255, 255)),
+    # Rango blanco flexible para fondos claros
+    "blanco": ((0, 0, 180), (180, 40, 255)),
+    # Detección complementaria de azul/cyan (suma confianza)
+    "azul": ((100, 50, 50), (130, 255, 255)),
+    "cyan": ((85, 50, 50), (95, 255, 255)),
+}
+# Clases que forman los "colores Plin"
+CLASES_COLOR_PLIN = ("turquesa", "azul", "cyan")
+# Submuestreo por defecto (1 = todos los píxeles, 2 = 1/4 de los píxeles, ...)
+PLIN_MUESTREO = int(os.getenv("PLIN_MUESTREO", "1"))
+# Ancho mínimo: los ratios de color apenas cambian entre 600 y 300 px (<0.2 puntos)
+PLIN_ANCHO_MINIMO = int(os.getenv("PLIN_ANCHO_MINIMO", "300"))
+
+def _construir_luts(rangos: Dict[str, tuple]) -> Tuple[np.ndarray, Dict[str, int]]:
+    """
+    Como los rangos son cajas en H, S y V, cada canal se traduce con una LUT
+    a una máscara de bits (un bit por clase); el AND de los tres canales da
+    todas las clases a las que pertenece cada píxel
+    """
+    luts = np.zeros((3, 256), np.uint8)
+    bits = {}
+    for i, (nombre, (inferior, superior)) in enumerate(rangos.items()):
+        bits[nombre] = 1 << i
+        for canal in range(3):
+            luts[canal, inferior[canal]:superior[canal] + 1] |= bits[nombre]
+    return luts, bits
+
+LUTS_PLIN, BITS_PLIN = _construir_luts(RANGOS_PLIN)
+BITS_COLOR_PLIN = sum(BITS_PLIN[c] for c in CLASES_COLOR_PLIN)
+CODIGOS_POSIBLES = 1 << len(BITS_PLIN)
+# Fila por conteo (cada clase y "colores_plin"): qué códigos suman a ese conteo
+_CODIGOS = np.arange(CODIGOS_POSIBLES)
+CODIGOS_POR_CONTEO = {
+    **{nombre: (_CODIGOS & bit) != 0 for nombre, bit in BITS_PLIN.items()},
+    "colores_plin": (_CODIGOS & BITS_COLOR_PLIN) != 0,
+}
+
+def submuestrear(imagen: np.ndarray, muestreo: int) -> np.ndarray:
+    """Vecino más cercano: no mezcla colores, así los rangos HSV siguen siendo válidos"""
+    if muestreo <= 1:
+        return imagen
+    alto, ancho = imagen.shape[:2]
+    return cv2.resize(
+        imagen,
+        (max(1, ancho // muestreo), max(1, alto // muestreo)),
+        interpolation=cv2.INTER_NEAREST
+    )
+
+@cronometrar("mascara_color")
+def contar_clases_color(hsv: np.ndarray) -> Dict[str, int]:
+    """
+    Clasifica todos los píxeles (LUT por canal + AND) en un código de bits y
+    cuenta todas las clases con un único histograma de esos códigos. Devuelve
+    el conteo por clase más "colores_plin": píxeles que caen en al menos una
+    de las clases de color Plin, sin contarlos dos veces
+    """
+    h, s, v = cv2.split(hsv)
+    codigos = cv2.bitwise_and(
+        cv2.bitwise_and(cv2.LUT(h, LUTS_PLIN[0]), cv2.LUT(s, LUTS_PLIN[1])),
+        cv2.LUT(v, LUTS_PLIN[2])
+    )
+    histograma = np.bincount(codigos.ravel(), minlength=CODIGOS_POSIBLES)
+    return {
+        nombre: int(histograma[incluidos].sum())
+        for nombre, incluidos in CODIGOS_POR_CONTEO.items()
+    }
+
 def is_plin_transaction(
     image_bytes: bytes,
     turquoise_ratio_thresh: float = 0.025,  # 2.5% (calibrado desde 2.8%)
-    white_ratio_thresh: float = 0.65        # 65% (calibrado desde 66.9%)
+    white_ratio_thresh: float = 0.65,       # 65% (calibrado desde 66.9%)
+    muestreo: int = PLIN_MUESTREO
 ) -> dict:
     """
     Detecta si una imagen es una transacción Plin válida
@@ -19,42 +96,40 @@ def is_plin_transaction(
     Parámetros calibrados basados en análisis real de capturas Plin:
     - Turquesa: mínimo 2.5% (rango amplio H[70-110])
     - Blanco: mínimo 65% (rango flexible para fondos claros)
+    - muestreo: analiza 1 de cada muestreo² píxeles (más rápido, ratios aproximados)
     """
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    img = cargar_imagen(image_bytes, ancho_minimo=PLIN_ANCHO_MINIMO)
     
     if img is None or img.size == 0:
         raise ValueError("Imagen corrupta o formato no soportado.")
     
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-    total_pixels = img.shape[0] * img.shape[1]
-    
-    # Rangos HSV optimizados (calibrados con imágenes reales)
-    lower_turquoise = np.array([70, 25, 35])
-    upper_turquoise = np.array([110, 255, 255])
-    
-    mask_turquoise = cv2.inRange(hsv, lower_turquoise, upper_turquoise)
-    turquoise_ratio = cv2.countNonZero(mask_turquoise) / total_pixels
-    
-    # Rango blanco flexible para fondos claros
-    lower_white = np.array([0, 0, 180])
-    upper_white = np.array([180, 40, 255])
-    
-    mask_white = cv2.inRange(hsv, lower_white, upper_white)
-    white_ratio = cv2.countNonZero(mask_white) / total_pixels
-    
-    # Detección complementaria de azul/cyan (opcional, suma confianza)
-    lower_blue = np.array([100, 50, 50])
-    upper_blue = np.array([130, 255, 255])
-    mask_blue = cv2.inRange(hsv, lower_blue, upper_blue)
-    blue_ratio = cv2.countNonZero(mask_blue) / total_pixels
+    # Se submuestrea antes de convertir a HSV para ahorrar también la conversión
+    hsv = cv2.cvtColor(submuestrear(normalizar_ancho(img, PLIN_ANCHO_MINIMO), muestreo), cv2.COLOR_BGR2HSV)
+    return evaluar_colores_plin(hsv, turquoise_ratio_thresh, white_ratio_thresh)
+
+
+def evaluar_colores_plin(
+    hsv: np.ndarray,
+    turquoise_ratio_thresh: float = 0.025,
+    white_ratio_thresh: float = 0.65,
+    muestreo: int = 1
+) -> dict:
+    """
+    Aplica la validación de colores Plin sobre una imagen ya convertida a HSV
+    (permite reutilizar la decodificación de otros filtros)
+    """
+    hsv = submuestrear(hsv, muestreo)
+    total_pixels = hsv.shape[0] * hsv.shape[1]
+    conteos = contar_clases_color(hsv)
     
-    lower_cyan = np.array([85, 50, 50])
-    upper_cyan = np.array([95, 255, 255])
-    mask_cyan = cv2.inRange(hsv, lower_cyan, upper_cyan)
-    cyan_ratio = cv2.countNonZero(mask_cyan) / total_pixels
+    turquoise_ratio = conteos["turquesa"] / total_pixels
+    white_ratio = conteos["blanco"] / total_pixels
+    blue_ratio = conteos["azul"] / total_pixels
+    cyan_ratio = conteos["cyan"] / total_pixels
+    # Unión sin solapes (un píxel turquesa y cyan cuenta una vez)
+    union_color_ratio = conteos["colores_plin"] / total_pixels
     
-    # Colores Plin combinados
+    # Colores Plin combinados: suma histórica (con solapes), sobre la que se calibró el umbral
     combined_color_ratio = turquoise_ratio + blue_ratio + cyan_ratio
     
     # Validación principal
@@ -82,9 +157,11 @@ def is_plin_transaction(
             "ratio_azul": round(blue_ratio * 100, 2),
             "ratio_cyan": round(cyan_ratio * 100, 2),
             "ratio_colores_plin": round(combined_color_ratio * 100, 2),
+            "ratio_colores_plin_union": round(union_color_ratio * 100, 2),
             "ratio_blanco": round(white_ratio * 100, 2),
             "confianza": confidence,
-            "score_confianza": round(confidence_score, 2)
+            "score_confianza": round(confidence_score, 2),
+            "pixeles_analizados": total_pixels
         }
     
     raise NotPlinTransaction(
@@ -94,27 +171,19 @@ def is_plin_transaction(
         f"Blanco detectado: {white_ratio*100:.2f}% "
         f"(mínimo {white_ratio_thresh*100:.1f}%). "
         f"[Turquesa: {turquoise_ratio*100:.2f}%, Azul: {blue_ratio*100:.2f}%, "
-        f"Cyan: {cyan_ratio*100:.2f}%]"
+        f"Cyan: {cyan_ratio*100:.2f}%, Unión: {union_color_ratio*100:.2f}%]"
     )
 
 
 @router.post("/filter_plin")
-async def filter_plin(file: UploadFile = File(...)):
-    if not file.content_type or not file.content_type.startswith('image/'):
-        raise HTTPException(
-            status_code=422,
-            detail="❌ El archivo debe ser una imagen válida (JPG, PNG, etc.)"
-        )
-    
+async def filter_plin(
+    file: UploadFile = File(...),
+    muestreo: int = Query(PLIN_MUESTREO, ge=1, le=8)
+):
     try:
-        img_bytes = await file.read()
-        if len(img_bytes) == 0:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ El archivo está vacío"
-            )
+        img_bytes = (await leer_imagen(file)).contenido
         
-        resultado = is_plin_transaction(img_bytes)
+        resultado = await ejecutor.ejecutar(is_plin_transaction, img_bytes, muestreo=muestreo)
         
         return {
             "resultado": "✅ Transacción Plin válida",
@@ -122,6 +191,8 @@ async def filter_plin(file: UploadFile = File(...)):
             **resultado
         }
         
+    except HTTPException:
+        raise
     except NotPlinTransaction as e:
         raise HTTPException(
             status_code=400, 
@@ -1,15 +1,40 @@
-import cv2
-import tempfile
 import os
+import cv2
+import numpy as np
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from filtros.recibo import cargar_imagen, normalizar_ancho, ANCHO_CANONICO
+from filtros.ejecutor import ejecutor
+from filtros.subida import leer_imagen
 
 router = APIRouter()
 
-def porcentaje_nitidez(image_path, max_var=400):
+# La varianza del Laplaciano depende de la resolución: max_var calibrado por
+# ancho de trabajo para que una captura Plin nítida dé ~100% (400 era el valor
+# a resolución original, 833 px de ancho)
+ANCHO_ORIGINAL_CALIBRACION = 833
+MAX_VAR_POR_ANCHO = {500: 790, 600: 540, ANCHO_ORIGINAL_CALIBRACION: 400}
+
+def max_var_calibrado(ancho: int = ANCHO_CANONICO) -> float:
+    """
+    Interpola entre los anchos calibrados (la curva baja al crecer el ancho);
+    fuera del rango se usa el extremo más cercano. 0 = resolución original
+    """
+    anchos = sorted(MAX_VAR_POR_ANCHO)
+    return float(np.interp(
+        ancho or ANCHO_ORIGINAL_CALIBRACION, anchos, [MAX_VAR_POR_ANCHO[a] for a in anchos]
+    ))
+
+NITIDEZ_MAX_VAR = float(os.getenv("NITIDEZ_MAX_VAR", str(max_var_calibrado())))
+# 0 = decodificación completa: la reducción DCT suaviza la imagen y el
+# porcentaje cae hasta 20 puntos a 1440 px respecto a la calibración
+NITIDEZ_ANCHO_MINIMO = 0
 
-    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    if image is None:
+def porcentaje_nitidez(imagen, max_var=NITIDEZ_MAX_VAR):
+    """Acepta bytes de la imagen, un arreglo (BGR o gris) o una ruta"""
+    image = cargar_imagen(imagen, cv2.IMREAD_GRAYSCALE)
+    if image is None or image.size == 0:
         raise ValueError("No se pudo cargar la imagen.")
+    image = normalizar_ancho(image)
     
     laplacian_var = cv2.Laplacian(image, cv2.CV_64F).var()
     
@@ -26,29 +51,13 @@ def clasificar_autenticidad(porcentaje):
 
 @router.post("/filtro_ruido")
 async def filtro_ruido(file: UploadFile = File(...)):
-    tmp_path = None
-    
     try:
-        if not file.content_type or not file.content_type.startswith('image/'):
-            raise HTTPException(
-                status_code=422, 
-                detail="❌ El archivo debe ser una imagen válida (JPG, PNG, etc.)"
-            )
-
-        content = await file.read()
-        
-        if len(content) == 0:
-            raise HTTPException(
-                status_code=422,
-                detail="❌ El archivo está vacío"
-            )
+        content = (await leer_imagen(file)).contenido
         
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-
         try:
-            porcentaje = porcentaje_nitidez(tmp_path)
+            porcentaje = await ejecutor.ejecutar(porcentaje_nitidez, content)
+        except HTTPException:
+            raise
         except ValueError as e:
             raise HTTPException(
                 status_code=422, 
@@ -76,10 +85,4 @@ async def filtro_ruido(file: UploadFile = File(...)):
         raise HTTPException(
             status_code=500, 
             detail=f"❌ Error inesperado: {str(e)}"
-        )
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
\ No newline at end of file
+        )
\ No newline at end of file
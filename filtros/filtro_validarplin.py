@@ -1,19 +1,16 @@
 # filtros/filtro_ocr.py
 from fastapi import APIRouter, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
-import requests
-import cv2
-import numpy as np
 import re
 from datetime import datetime
+from filtros.cliente_ocr import servicio_ocr
+from filtros.ejecutor import ejecutor
+from filtros.subida import leer_imagen
 
 
 
 router = APIRouter()
 
-API_KEY = 'e0b0a3ad7d88957'
-OCR_API_URL = 'https://api.ocr.space/parse/image'
-
 destinos_validos = ["Plin", "BCP", "Interbank", "Scotiabank", "BBVA", "Yape"]
 comisiones_permitidas_literal = ["GRATIS", "GRATIS.", "GRATIS "]
 palabras_negra = ["PELIGRO", "BLOQUEADA", "ESTAFA", "FRAUDE", "ANULADO", "REEMBOLSO", "ERROR"]
@@ -26,17 +23,17 @@ monto_regex = re.compile(r"^[Ss]/\s*([\d]{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2})?)\s*
 fecha_regex = re.compile(r"^\d{2}\s[A-Za-z]{3}\s\d{4}\s\d{2}:\d{2}\s(?:AM|PM)$")
 
 # --- Funciones auxiliares ---
-def enviar_a_ocr_bytes(imagen_bytes):
-    files = {'filename': ('imagen.jpg', imagen_bytes, 'image/jpeg')}
+async def enviar_a_ocr_bytes(imagen_bytes):
     payload = {
-        'apikey': API_KEY,
         'language': 'spa',
-        'isOverlayRequired': True,
-        'OCREngine': 2
+        'isOverlayRequired': 'True',
+        'OCREngine': '2'
     }
     try:
-        respuesta = requests.post(OCR_API_URL, files=files, data=payload, timeout=30)
-        return respuesta.json()
+        _, resultado = await servicio_ocr.consultar(
+            ('imagen.jpg', imagen_bytes, 'image/jpeg'), payload, campo='filename'
+        )
+        return resultado
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error enviando imagen al OCR: {e}")
 
@@ -94,7 +91,7 @@ def analizar_distancias_verticales(centers):
     return True, ""
 
 # --- Función principal de validación ---
-def validar_comprobante(parsed_results, imagen):
+def validar_comprobante(parsed_results):
     resultado = {"valido": False, "errores": [], "advertencias": [], "campos": {}}
     texto_detectado = parsed_results.get('ParsedText', '')
     if isinstance(texto_detectado, bytes):
@@ -237,13 +234,9 @@ def validar_comprobante(parsed_results, imagen):
 # --- Endpoint POST ---
 @router.post("/validarplin")
 async def filtro_ocr(file: UploadFile = File(...)):
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=422, detail="El archivo debe ser una imagen")
-    imagen_bytes = await file.read()
-    if not imagen_bytes:
-        raise HTTPException(status_code=422, detail="Archivo vacío")
+    imagen_bytes = (await leer_imagen(file)).contenido
 
-    ocr_result = enviar_a_ocr_bytes(imagen_bytes)
+    ocr_result = await enviar_a_ocr_bytes(imagen_bytes)
     if not ocr_result or ocr_result.get('IsErroredOnProcessing'):
         raise HTTPException(status_code=422, detail=ocr_result.get('ErrorMessage', 'OCR falló'))
 
@@ -252,9 +245,6 @@ async def filtro_ocr(file: UploadFile = File(...)):
         raise HTTPException(status_code=422, detail="No se encontraron resultados OCR")
     first = parsed_results[0]
 
-    # Decodificar la imagen para OpenCV (opcional)
-    nparr = np.frombuffer(imagen_bytes, np.uint8)
-    imagen = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-    resultado = validar_comprobante(first, imagen)
+    # La validación solo usa el texto del OCR: no hace falta decodificar la imagen
+    resultado = await ejecutor.ejecutar(validar_comprobante, first)
     return JSONResponse(content=resultado)
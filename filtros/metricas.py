@@ -0,0 +1,249 @@
+# Métricas de latencia por etapa: /metrics (formato Prometheus) y cabecera Server-Timing
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from pymongo import monitoring
+
+load_dotenv()
+
+METRICAS_HABILITADAS = os.getenv("METRICAS_HABILITADAS", "1").lower() in ("1", "true", "si")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "si")
+# Límites de los histogramas, en segundos
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+router = APIRouter()
+
+# Etapas medidas durante la petición en curso (las ven también los hilos del ejecutor)
+_etapas_peticion: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "etapas_peticion", default=None
+)
+
+
+class Histograma:
+    """Buckets acumulativos al estilo Prometheus para una combinación de etiquetas"""
+
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self.conteos = [0] * len(buckets)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        indice = bisect.bisect_left(self.buckets, valor)
+        if indice < len(self.conteos):
+            self.conteos[indice] += 1
+        self.suma += valor
+        self.total += 1
+
+    def acumulados(self) -> List[int]:
+        acumulado, salida = 0, []
+        for conteo in self.conteos:
+            acumulado += conteo
+            salida.append(acumulado)
+        return salida
+
+
+class RegistroMetricas:
+    """
+    Histogramas y contadores en memoria del proceso. Cada métrica se indexa
+    por una tupla de valores de etiquetas; se exporta en texto Prometheus.
+    """
+
+    def __init__(self):
+        self._histogramas: Dict[str, Dict[tuple, Histograma]] = defaultdict(dict)
+        self._contadores: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        self._indicadores: Dict[str, Callable[[], float]] = {}
+        self._descripciones: Dict[str, Tuple[str, str, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def _describir(self, nombre: str, tipo: str, ayuda: str, etiquetas: tuple):
+        self._descripciones.setdefault(nombre, (tipo, ayuda, etiquetas))
+
+    def observar(self, nombre: str, valor: float, ayuda: str = "", **etiquetas):
+        self._describir(nombre, "histogram", ayuda, tuple(etiquetas))
+        clave = tuple(etiquetas.values())
+        with self._lock:
+            histograma = self._histogramas[nombre].get(clave)
+            if histograma is None:
+                histograma = self._histogramas[nombre][clave] = Histograma()
+            histograma.observar(valor)
+
+    def incrementar(self, nombre: str, valor: float = 1, ayuda: str = "", **etiquetas):
+        self._describir(nombre, "counter", ayuda, tuple(etiquetas))
+        with self._lock:
+            self._contadores[nombre][tuple(etiquetas.values())] += valor
+
+    def indicador(self, nombre: str, funcion: Callable[[], float], ayuda: str = ""):
+        """Valor instantáneo leído al exportar (p. ej. trabajos pendientes del ejecutor)"""
+        self._describir(nombre, "gauge", ayuda, ())
+        self._indicadores[nombre] = funcion
+
+    def reiniciar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    def exportar(self) -> str:
+        lineas = []
+        with self._lock:
+            for nombre, (tipo, ayuda, etiquetas) in sorted(self._descripciones.items()):
+                if tipo == "gauge":
+                    try:
+                        valor = float(self._indicadores[nombre]())
+                    except Exception:
+                        continue
+                lineas.append(f"# HELP {nombre} {ayuda}")
+                lineas.append(f"# TYPE {nombre} {tipo}")
+                if tipo == "histogram":
+                    for clave, h in sorted(self._histogramas[nombre].items()):
+                        base = _etiquetas(etiquetas, clave)
+                        for limite, acumulado in zip(h.buckets, h.acumulados()):
+                            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, clave, le=limite)} {acumulado}")
+                        lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, clave, le='+Inf')} {h.total}")
+                        lineas.append(f"{nombre}_sum{base} {h.suma:.6f}")
+                        lineas.append(f"{nombre}_count{base} {h.total}")
+                elif tipo == "counter":
+                    for clave, valor in sorted(self._contadores[nombre].items()):
+                        lineas.append(f"{nombre}{_etiquetas(etiquetas, clave)} {valor:g}")
+                else:
+                    lineas.append(f"{nombre} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _etiquetas(nombres: tuple, valores: tuple, le=None) -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if le is not None:
+        pares.append(f'le="{le}"')
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+metricas = RegistroMetricas()
+
+
+def registrar_etapa(etapa: str, segundos: float, error: bool = False):
+    """Anota la duración en el histograma global y en la petición en curso"""
+    if not METRICAS_HABILITADAS:
+        return
+    metricas.observar(
+        "filtros_etapa_duracion_segundos", segundos,
+        "Duración de cada etapa de procesamiento", etapa=etapa
+    )
+    if error:
+        metricas.incrementar("filtros_etapa_errores_total", 1, "Etapas que terminaron con excepción", etapa=etapa)
+    etapas = _etapas_peticion.get()
+    if etapas is not None:
+        # list.append es atómico: varios hilos pueden anotar en la misma petición
+        etapas.append((etapa, segundos))
+
+@contextmanager
+def medir(etapa: str):
+    """with medir("orb_deteccion"): ... — cronometra el bloque"""
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        registrar_etapa(etapa, time.perf_counter() - inicio, error)
+
+def cronometrar(etapa: str):
+    """Decorador equivalente a medir() para una función completa"""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(etapa):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+class MonitorMongo(monitoring.CommandListener):
+    """
+    Tiempo de cada comando de Mongo (find, insert, update...). Motor ejecuta
+    pymongo copiando el contexto, así que también aparece en Server-Timing.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        registrar_etapa(f"mongo_{event.command_name.lower()}", event.duration_micros / 1e6)
+
+    def failed(self, event):
+        registrar_etapa(f"mongo_{event.command_name.lower()}", event.duration_micros / 1e6, error=True)
+
+
+def server_timing(etapas: List[Tuple[str, float]], total: float) -> str:
+    """Agrupa las etapas por nombre (suma de duraciones, en ms) en orden de aparición"""
+    acumulado: Dict[str, float] = {}
+    for etapa, segundos in etapas:
+        acumulado[etapa] = acumulado.get(etapa, 0.0) + segundos
+    partes = [f"{etapa};dur={segundos * 1000:.1f}" for etapa, segundos in acumulado.items()]
+    partes.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(partes)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI: duración y código de cada petición por ruta, y la
+    cabecera Server-Timing con las etapas medidas hasta enviar la respuesta.
+    Con respuestas en streaming (p. ej. /analizar/lote) la cabecera solo
+    incluye lo ocurrido antes del primer byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICAS_HABILITADAS:
+            await self.app(scope, receive, send)
+            return
+
+        etapas: List[Tuple[str, float]] = []
+        token = _etapas_peticion.set(etapas)
+        inicio = time.perf_counter()
+        codigo = 500
+
+        async def enviar(mensaje):
+            nonlocal codigo
+            if mensaje["type"] == "http.response.start":
+                codigo = mensaje["status"]
+                if SERVER_TIMING:
+                    cabecera = server_timing(list(etapas), time.perf_counter() - inicio)
+                    mensaje["headers"] = [*mensaje.get("headers", []), (b"server-timing", cabecera.encode("latin-1"))]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _etapas_peticion.reset(token)
+            # Plantilla de la ruta ("/filtro_logo/plin"), no la URL: cardinalidad acotada
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            metricas.observar(
+                "http_peticion_duracion_segundos", time.perf_counter() - inicio,
+                "Duración de las peticiones HTTP", ruta=ruta, metodo=scope["method"]
+            )
+            metricas.incrementar(
+                "http_peticiones_total", 1, "Peticiones HTTP atendidas",
+                ruta=ruta, metodo=scope["method"], codigo=str(codigo)
+            )
+
+
+@router.get("/metrics", include_in_schema=False)
+async def exportar_metricas():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,132 @@
+# Perfiles de distancias del logo precalculados por plantilla
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Optional
+
+RUTA_PERFILES = "./config/distancias_guardadas.json"
+
+# Subir la versión cuando cambie la forma de calcular las distancias:
+# los perfiles guardados con otra versión se descartan y se recalculan.
+VERSION_PERFILES = 2
+
+def hash_archivo(ruta: str) -> Optional[str]:
+    try:
+        with open(ruta, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def clave_perfil(hash_plantilla: str, ancho: int) -> str:
+    return f"{hash_plantilla}@w{ancho}"
+
+
+class AlmacenPerfilesLogo:
+    """
+    Distancias logo-bordes de cada plantilla, indexadas por hash SHA-256 de
+    la plantilla y ancho de trabajo. Se sirven desde memoria y se persisten
+    en JSON para no repetir la búsqueda del logo en cada arranque.
+    """
+
+    def __init__(self, ruta: str = RUTA_PERFILES):
+        self.ruta = ruta
+        self.hash_logo: Optional[str] = None
+        self.cargado = False
+        self._perfiles: Dict[str, Dict] = {}
+        self._pendiente = False
+        self._lock = threading.Lock()
+
+    def cargar(self, hash_logo: Optional[str]) -> int:
+        """Lee el archivo de perfiles; ignora versiones o logos distintos"""
+        self.hash_logo = hash_logo
+        perfiles = {}
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if (isinstance(data, dict)
+                    and data.get("version") == VERSION_PERFILES
+                    and data.get("logo_sha256") == hash_logo):
+                perfiles = data.get("perfiles", {})
+        except (OSError, ValueError) as e:
+            print(f"⚠️  No se pudieron leer los perfiles de logo: {e}")
+        with self._lock:
+            self._perfiles = perfiles
+            self._pendiente = False
+        self.cargado = True
+        return len(perfiles)
+
+    def limpiar(self):
+        with self._lock:
+            self._perfiles = {}
+            self._pendiente = True
+
+    def guardar(self):
+        with self._lock:
+            data = {
+                "version": VERSION_PERFILES,
+                "logo_sha256": self.hash_logo,
+                "perfiles": dict(self._perfiles)
+            }
+            self._pendiente = False
+        directorio = os.path.dirname(self.ruta) or "."
+        os.makedirs(directorio, exist_ok=True)
+        # Temporal propio de cada escritor: varios hilos pueden guardar a la vez
+        descriptor, temporal = tempfile.mkstemp(
+            dir=directorio, prefix=os.path.basename(self.ruta) + ".", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(temporal, self.ruta)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except OSError:
+                pass
+            raise
+
+    def guardar_si_cambio(self):
+        if self._pendiente:
+            self.guardar()
+
+    def obtener(
+        self,
+        hash_plantilla: str,
+        ancho: int,
+        nombre: str,
+        calcular: Callable[[], Optional[Dict[str, int]]],
+        persistir: bool = True
+    ) -> Optional[Dict[str, int]]:
+        """Devuelve el perfil guardado o lo calcula (y persiste) si falta"""
+        clave = clave_perfil(hash_plantilla, ancho)
+        perfil = self._perfiles.get(clave)
+        if perfil is not None:
+            return perfil["distancias"]
+
+        distancias = calcular()
+        if distancias is None:
+            return None
+        with self._lock:
+            self._perfiles[clave] = {
+                "plantilla": nombre,
+                "ancho": ancho,
+                "distancias": distancias
+            }
+            self._pendiente = True
+        if persistir:
+            try:
+                self.guardar()
+            except OSError as e:
+                print(f"⚠️  No se pudieron guardar los perfiles de logo: {e}")
+        return distancias
+
+
+if __name__ == "__main__":
+    import sys
+    from filtros.filtro_logo import precargar_perfiles_logo, ANCHO_LOGO
+
+    ancho = int(sys.argv[1]) if len(sys.argv) > 1 else ANCHO_LOGO
+    total = precargar_perfiles_logo(ancho=ancho, reconstruir=True)
+    print(f"✅ {total} perfiles de logo guardados en {RUTA_PERFILES} (ancho {ancho} px)")
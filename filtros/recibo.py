@@ -0,0 +1,254 @@
+# Recibo decodificado compartido entre filtros
+import io
+import os
+import threading
+from functools import cached_property
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image
+from filtros.metricas import medir
+from filtros.subida import detectar_formato, dimensiones_cabecera
+
+load_dotenv()
+
+# Ancho de trabajo común de los filtros de imagen (0 = resolución original).
+# Los umbrales dependientes de la resolución (nitidez, ORB) están calibrados a este ancho.
+ANCHO_CANONICO = int(os.getenv("ANCHO_CANONICO", "600"))
+# Escalas DCT de libjpeg: el JPEG se decodifica directamente a 1/2, 1/4 u 1/8
+# del tamaño (de 3 a 10 veces más rápido que decodificar todo y reducir)
+REDUCCIONES_JPEG = {
+    8: (cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    4: (cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    2: (cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+}
+
+
+def factor_reduccion(ancho_original: int, ancho_minimo: int) -> int:
+    """Mayor factor DCT (8, 4, 2) que conserva al menos ancho_minimo px; 1 = decodificación completa"""
+    if not ancho_minimo or not ancho_original:
+        return 1
+    for factor in REDUCCIONES_JPEG:
+        # libjpeg redondea hacia arriba
+        if -(-ancho_original // factor) >= ancho_minimo:
+            return factor
+    return 1
+
+def flags_decodificacion(contenido: bytes, flags: int = cv2.IMREAD_COLOR, ancho_minimo: int = 0) -> int:
+    """
+    Flags de cv2.imdecode para la escala JPEG más pequeña que conserva
+    ancho_minimo. Los demás formatos (y ancho_minimo=0) se decodifican completos.
+    """
+    if not ancho_minimo or flags not in (cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE):
+        return flags
+    if detectar_formato(contenido[:16]) != "jpeg":
+        return flags
+    dimensiones = dimensiones_cabecera(contenido, "jpeg")
+    # El lado menor: si la orientación EXIF gira la imagen, el ancho sigue alcanzando
+    factor = factor_reduccion(min(dimensiones) if dimensiones else 0, ancho_minimo)
+    if factor == 1:
+        return flags
+    color, gris = REDUCCIONES_JPEG[factor]
+    return gris if flags == cv2.IMREAD_GRAYSCALE else color
+
+def cargar_imagen(
+    imagen: Union[bytes, np.ndarray, str],
+    flags: int = cv2.IMREAD_COLOR,
+    ancho_minimo: int = 0
+) -> np.ndarray:
+    """
+    Acepta bytes en memoria, un arreglo ya decodificado o una ruta y
+    devuelve la imagen en BGR (IMREAD_COLOR) o en gris (IMREAD_GRAYSCALE).
+    Con ancho_minimo, los JPEG en bytes se decodifican a escala reducida:
+    el resultado tiene al menos ese ancho (o el original, si es menor).
+    """
+    if isinstance(imagen, np.ndarray):
+        if flags == cv2.IMREAD_GRAYSCALE and imagen.ndim == 3:
+            return cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+        if flags == cv2.IMREAD_COLOR and imagen.ndim == 2:
+            return cv2.cvtColor(imagen, cv2.COLOR_GRAY2BGR)
+        return imagen
+    if isinstance(imagen, (bytes, bytearray, memoryview)):
+        flags = flags_decodificacion(imagen, flags, ancho_minimo)
+        with medir("decodificar"):
+            return cv2.imdecode(np.frombuffer(imagen, np.uint8), flags)
+    return cv2.imread(imagen, flags)
+
+
+def normalizar_ancho(imagen: np.ndarray, ancho: int = ANCHO_CANONICO, ampliar: bool = False) -> np.ndarray:
+    """
+    Reescala la imagen al ancho canónico conservando la proporción. Por
+    defecto solo reduce; con ampliar=True también agranda (filtros que
+    comparan distancias absolutas en píxeles). Es idempotente.
+    """
+    if imagen is None or imagen.size == 0 or not ancho:
+        return imagen
+    alto_actual, ancho_actual = imagen.shape[:2]
+    if ancho_actual == ancho or (ancho_actual < ancho and not ampliar):
+        return imagen
+    alto = max(1, round(alto_actual * ancho / ancho_actual))
+    interpolacion = cv2.INTER_AREA if ancho_actual > ancho else cv2.INTER_CUBIC
+    with medir("reescalar"):
+        return cv2.resize(imagen, (ancho, alto), interpolation=interpolacion)
+
+
+def abrir_pil_rgb(contenido: bytes, ancho_minimo: int = 0) -> Image.Image:
+    """
+    Imagen PIL en RGB. Con ancho_minimo, draft() pide a libjpeg la escala
+    reducida y el resultado se lleva a ese ancho (ver normalizar_ancho)
+    """
+    imagen = Image.open(io.BytesIO(contenido))
+    if ancho_minimo and imagen.width > ancho_minimo:
+        escala = ancho_minimo / imagen.width
+        with medir("decodificar"):
+            # draft solo afecta a JPEG y elige la escala que no baja del tamaño pedido
+            imagen.draft("RGB", (ancho_minimo, max(1, round(imagen.height * escala))))
+            imagen = imagen.convert("RGB")
+        if imagen.width > ancho_minimo:
+            with medir("reescalar"):
+                imagen = imagen.resize(
+                    (ancho_minimo, max(1, round(imagen.height * ancho_minimo / imagen.width))),
+                    Image.Resampling.BOX
+                )
+        return imagen
+    with medir("decodificar"):
+        return imagen.convert("RGB")
+
+
+class ReciboDecodificado:
+    """
+    Representación en memoria de un comprobante subido.
+
+    Cada filtro declara el ancho mínimo que necesita y pide esa vista; los
+    bytes se decodifican una sola vez, a la escala JPEG más pequeña que
+    cubre al filtro más exigente, y las vistas más pequeñas se derivan de
+    la ya decodificada. Las vistas BGR, gris, HSV y PIL del ancho canónico
+    quedan cacheadas para los siguientes filtros. El OCR y el EXIF siguen
+    usando los bytes originales.
+    """
+
+    def __init__(self, contenido: bytes, ancho_canonico: int = ANCHO_CANONICO):
+        if not contenido:
+            raise ValueError("El archivo está vacío")
+        self.contenido = contenido
+        self.ancho_canonico = ancho_canonico
+        self._vistas: Dict[int, np.ndarray] = {}
+        # Anchos cuyas vistas vienen de una decodificación JPEG reducida
+        self._reducidas: Set[int] = set()
+        self._lock = threading.Lock()
+
+    @cached_property
+    def original(self) -> np.ndarray:
+        nparr = np.frombuffer(self.contenido, np.uint8)
+        with medir("decodificar"):
+            imagen = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if imagen is None or imagen.size == 0:
+            raise ValueError("Imagen corrupta o formato no soportado.")
+        return imagen
+
+    @cached_property
+    def dimensiones(self) -> Tuple[int, int]:
+        """(ancho, alto) de la imagen original, leídos de la cabecera si es posible"""
+        formato = detectar_formato(self.contenido[:16])
+        dimensiones = dimensiones_cabecera(self.contenido, formato) if formato else None
+        if not dimensiones or not all(dimensiones):
+            alto, ancho = self.original.shape[:2]
+            return ancho, alto
+        return dimensiones
+
+    def vista(self, ancho_minimo: int, completa: bool = False) -> np.ndarray:
+        """
+        BGR reducida a ancho_minimo (nunca se amplía; 0 = original). Se
+        deriva de la vista cacheada más pequeña que alcance o, si no hay
+        ninguna, se decodifica con la reducción JPEG que la cubre. Con
+        completa=True solo se deriva de la decodificación completa (filtros
+        cuyos umbrales se calibraron así).
+        """
+        if not ancho_minimo:
+            return self.original
+        with self._lock:
+            vista = self._vistas.get(ancho_minimo)
+            if vista is not None and not (completa and ancho_minimo in self._reducidas):
+                return vista
+            candidatas = [
+                (ancho, v) for ancho, v in self._vistas.items()
+                if v.shape[1] >= ancho_minimo and not (completa and ancho in self._reducidas)
+            ]
+            if "original" in self.__dict__:
+                candidatas.append((0, self.original))
+            if candidatas:
+                # Con proporción entera INTER_AREA es un promedio por bloques (~20x más rápido)
+                ancho_base, base = min(candidatas, key=lambda c: (c[1].shape[1] % ancho_minimo != 0, c[1].shape[1]))
+                reducida = ancho_base in self._reducidas
+            elif completa:
+                base, reducida = self.original, False
+            else:
+                base = self._decodificar_reducida(ancho_minimo)
+                reducida = base is not self.__dict__.get("original")
+            vista = self._vistas[ancho_minimo] = normalizar_ancho(base, ancho_minimo)
+            if reducida:
+                self._reducidas.add(ancho_minimo)
+            else:
+                self._reducidas.discard(ancho_minimo)
+            return vista
+
+    def _decodificar_reducida(self, ancho_minimo: int) -> np.ndarray:
+        flags = flags_decodificacion(self.contenido, cv2.IMREAD_COLOR, ancho_minimo)
+        if flags == cv2.IMREAD_COLOR:
+            return self.original
+        with medir("decodificar"):
+            imagen = cv2.imdecode(np.frombuffer(self.contenido, np.uint8), flags)
+        if imagen is None or imagen.size == 0:
+            raise ValueError("Imagen corrupta o formato no soportado.")
+        return imagen
+
+    @cached_property
+    def bgr(self) -> np.ndarray:
+        return self.vista(self.ancho_canonico)
+
+    @property
+    def escala(self) -> float:
+        """Factor entre el espacio de trabajo y la imagen original"""
+        return self.bgr.shape[1] / self.ancho
+
+    @cached_property
+    def gris(self) -> np.ndarray:
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def hsv(self) -> np.ndarray:
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2HSV)
+
+    @cached_property
+    def pil(self) -> Image.Image:
+        # Image.open solo lee la cabecera; los píxeles se cargan al usarlos
+        return Image.open(io.BytesIO(self.contenido))
+
+    @cached_property
+    def pil_rgb(self) -> Image.Image:
+        return Image.fromarray(cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    def decodificar(self, anchos: Optional[Iterable[int]] = None) -> "ReciboDecodificado":
+        """
+        Prepara las vistas que van a pedir los filtros (por defecto la del
+        ancho canónico); conviene llamarlo antes de usar el recibo desde
+        varios hilos para no decodificar dos veces. Los anchos se preparan
+        de mayor a menor para que los pequeños se deriven de los grandes.
+        """
+        anchos = {self.ancho_canonico} if anchos is None else set(anchos)
+        # 0 (original) primero: cualquier otra vista se deriva de ella
+        for ancho in sorted(anchos, key=lambda a: a or float("inf"), reverse=True):
+            self.vista(ancho)
+        if self.ancho_canonico in anchos:
+            self.gris
+        return self
+
+    @property
+    def ancho(self) -> int:
+        return self.dimensiones[0]
+
+    @property
+    def alto(self) -> int:
+        return self.dimensiones[1]
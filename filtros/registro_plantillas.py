@@ -0,0 +1,64 @@
+# Registro de plantillas precargadas
+import glob
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+EXTENSIONES_PLANTILLA = ['*.jpg', '*.jpeg', '*.png', '*.bmp']
+
+
+class RegistroPlantillas:
+    """
+    Carga cada plantilla del directorio una sola vez y guarda el resultado
+    de `cargar(ruta)` en memoria. Una plantilla solo se vuelve a procesar
+    cuando cambia su mtime; las que se borran del disco salen del registro.
+    """
+
+    def __init__(self, directorio: str, cargar: Callable[[str], Any]):
+        self.directorio = directorio
+        self._cargar = cargar
+        self._entradas: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def rutas(self) -> List[str]:
+        rutas = []
+        for ext in EXTENSIONES_PLANTILLA:
+            rutas.extend(glob.glob(os.path.join(self.directorio, ext)))
+        return sorted(rutas)
+
+    def obtener(self, ruta: str) -> Optional[Any]:
+        """Devuelve la plantilla procesada, recargándola si cambió en disco"""
+        try:
+            mtime = os.stat(ruta).st_mtime
+        except OSError:
+            with self._lock:
+                self._entradas.pop(ruta, None)
+            return None
+
+        entrada = self._entradas.get(ruta)
+        if entrada is not None and entrada[0] == mtime:
+            return entrada[1]
+
+        with self._lock:
+            entrada = self._entradas.get(ruta)
+            if entrada is None or entrada[0] != mtime:
+                entrada = (mtime, self._cargar(ruta))
+                self._entradas[ruta] = entrada
+        return entrada[1]
+
+    def todas(self) -> List[Tuple[str, Any]]:
+        """Plantillas actuales del directorio (omite las que no se pudieron cargar)"""
+        rutas = self.rutas()
+        with self._lock:
+            for ruta in set(self._entradas) - set(rutas):
+                del self._entradas[ruta]
+        plantillas = []
+        for ruta in rutas:
+            plantilla = self.obtener(ruta)
+            if plantilla is not None:
+                plantillas.append((ruta, plantilla))
+        return plantillas
+
+    def precargar(self) -> int:
+        """Procesa todas las plantillas (pensado para el arranque del servicio)"""
+        return len(self.todas())
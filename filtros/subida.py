@@ -0,0 +1,167 @@
+# Lectura acotada de las subidas: tamaño máximo, tipo real por firma y dimensiones por cabecera
+import io
+import os
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile
+from PIL import Image
+
+from filtros.metricas import medir
+
+load_dotenv()
+
+SUBIDA_MAX_BYTES = int(os.getenv("SUBIDA_MAX_BYTES", str(10 * 1024 * 1024)))
+# Ancho x alto máximo: una captura de móvil ronda 2-4 MP; un PNG de pocos KB
+# puede declarar 50000x50000 y hacer que cv2.imdecode reserve gigabytes
+SUBIDA_MAX_PIXELES = int(os.getenv("SUBIDA_MAX_PIXELES", str(40_000_000)))
+TAMANO_BLOQUE = 256 * 1024
+
+FIRMAS_IMAGEN = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+)
+# Marcadores SOF de JPEG (sin DHT=C4, JPG=C8 ni DAC=CC), que llevan alto y ancho
+MARCADORES_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImagenSubida(NamedTuple):
+    contenido: bytes
+    formato: str
+    ancho: int
+    alto: int
+    nombre: Optional[str] = None
+
+
+def detectar_formato(cabecera: bytes) -> Optional[str]:
+    """Formato real según los primeros bytes; None si no es una imagen soportada"""
+    for firma, formato in FIRMAS_IMAGEN:
+        if cabecera.startswith(firma):
+            return formato
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+def _dimensiones_jpeg(contenido: bytes) -> Optional[Tuple[int, int]]:
+    """Recorre los segmentos hasta el primer SOF sin decodificar la imagen"""
+    i, n = 2, len(contenido)
+    while i + 4 <= n:
+        if contenido[i] != 0xFF:
+            return None
+        marcador = contenido[i + 1]
+        if marcador == 0xFF:  # relleno
+            i += 1
+            continue
+        if marcador in (0x01, 0xD8) or 0xD0 <= marcador <= 0xD7:
+            i += 2
+            continue
+        if marcador in (0xD9, 0xDA):  # fin de imagen o inicio de datos sin SOF
+            return None
+        longitud = struct.unpack(">H", contenido[i + 2:i + 4])[0]
+        if marcador in MARCADORES_SOF:
+            if i + 9 > n:
+                return None
+            alto, ancho = struct.unpack(">HH", contenido[i + 5:i + 9])
+            return ancho, alto
+        i += 2 + longitud
+    return None
+
+def _dimensiones_png(contenido: bytes) -> Optional[Tuple[int, int]]:
+    if len(contenido) < 24 or contenido[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", contenido[16:24])
+
+def dimensiones_cabecera(contenido: bytes, formato: str) -> Optional[Tuple[int, int]]:
+    """(ancho, alto) leídos de la cabecera; PIL solo para los formatos menos comunes"""
+    if formato == "jpeg":
+        return _dimensiones_jpeg(contenido)
+    if formato == "png":
+        return _dimensiones_png(contenido)
+    try:
+        # Image.open solo lee la cabecera
+        return Image.open(io.BytesIO(contenido)).size
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+def validar_imagen(
+    contenido: bytes,
+    nombre: Optional[str] = None,
+    max_pixeles: int = SUBIDA_MAX_PIXELES
+) -> ImagenSubida:
+    """
+    Comprueba firma y dimensiones antes de decodificar. Lanza HTTPException
+    422 (vacía, no es imagen, cabecera dañada) o 413 (demasiados píxeles).
+    """
+    if not contenido:
+        raise HTTPException(status_code=422, detail="❌ El archivo está vacío")
+    formato = detectar_formato(contenido[:16])
+    if formato is None:
+        raise HTTPException(
+            status_code=422,
+            detail="❌ El archivo debe ser una imagen válida (JPG, PNG, etc.)"
+        )
+    try:
+        dimensiones = dimensiones_cabecera(contenido, formato)
+    except Image.DecompressionBombError:
+        dimensiones = (max_pixeles, max_pixeles)
+    if not dimensiones or not all(dimensiones):
+        raise HTTPException(status_code=422, detail="❌ Imagen corrupta: no se pudieron leer sus dimensiones")
+    ancho, alto = dimensiones
+    if ancho * alto > max_pixeles:
+        raise HTTPException(
+            status_code=413,
+            detail=f"❌ La imagen es demasiado grande ({ancho}x{alto}; máximo {max_pixeles // 1_000_000} MP)"
+        )
+    return ImagenSubida(contenido, formato, ancho, alto, nombre)
+
+async def leer_con_limite(
+    archivo: UploadFile,
+    max_bytes: int = SUBIDA_MAX_BYTES,
+    solo_imagenes: bool = False
+) -> bytes:
+    """
+    Lee la subida por bloques y corta en cuanto supera max_bytes. El tamaño
+    que informa Starlette es el recibido (no la cabecera del cliente), así
+    que los archivos grandes se rechazan sin cargarlos en memoria. Con
+    solo_imagenes, si el primer bloque no tiene firma de imagen no se lee más.
+    """
+    if archivo.size is not None and archivo.size > max_bytes:
+        raise _error_tamano(max_bytes)
+    bloques, total = [], 0
+    while True:
+        bloque = await archivo.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        total += len(bloque)
+        if total > max_bytes:
+            raise _error_tamano(max_bytes)
+        bloques.append(bloque)
+        if solo_imagenes and len(bloques) == 1 and detectar_formato(bloque[:16]) is None:
+            break
+    return bloques[0] if len(bloques) == 1 else b"".join(bloques)
+
+def _error_tamano(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"❌ El archivo es demasiado grande (máximo {max_bytes // (1024 * 1024)} MB)"
+    )
+
+async def leer_imagen(
+    archivo: UploadFile,
+    max_bytes: int = SUBIDA_MAX_BYTES,
+    max_pixeles: int = SUBIDA_MAX_PIXELES
+) -> ImagenSubida:
+    """
+    Punto de entrada de las rutas: devuelve un único buffer validado que
+    comparten todos los filtros. El tipo se decide por la firma del
+    contenido, no por el Content-Type que envía el cliente.
+    """
+    with medir("subida"):
+        contenido = await leer_con_limite(archivo, max_bytes, solo_imagenes=True)
+        return validar_imagen(contenido, archivo.filename, max_pixeles)
@@ -1,53 +1,85 @@
 # Login
+import uuid
 from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from bson import ObjectId
-from bd import users_coll
-from auth import create_password_reset_token, reset_password
+from pymongo.errors import DuplicateKeyError
+from bd import users_coll, indices_usuarios_confirmados
+from auth import create_password_reset_token, reset_password, find_user_by_login
 from typing import Optional
 from schemas import UserCreate, UserOut, Token, PasswordChange, RequestPasswordReset, ConfirmPasswordReset
-from auth import get_password_hash, verify_password, create_access_token, get_current_user, save_token, revoke_token, revoke_all_tokens
+from auth import create_access_token, get_current_user, save_token, revoke_token, revoke_all_tokens
+from auth import cache_sesiones, get_password_hash_async, verify_password_async, verify_and_update_password
 
 router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+def _error_duplicado(campo: str) -> HTTPException:
+    if campo == "username":
+        return HTTPException(status.HTTP_400_BAD_REQUEST,
+            detail={"error_code":"USERNAME_TAKEN","message":"Usuario ya en uso"})
+    return HTTPException(status.HTTP_400_BAD_REQUEST,
+        detail={"error_code":"USER_EXISTS","message":"Email ya registrado"})
+
+def _campo_duplicado(e: DuplicateKeyError) -> str:
+    """Campo del índice único violado, sin mirar el valor duplicado"""
+    detalles = e.details or {}
+    campos = detalles.get("keyPattern") or detalles.get("keyValue")
+    if campos:
+        return "username" if "username" in campos else "email"
+    # Sin keyPattern/keyValue solo queda el nombre del índice en errmsg
+    return "username" if "index: username_" in detalles.get("errmsg", "") else "email"
+
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 async def register(user: UserCreate):
-    if await users_coll.find_one({"email": user.email}):
-        raise HTTPException(status.HTTP_400_BAD_REQUEST,
-            detail={"error_code":"USER_EXISTS","message":"Email ya registrado"})
-    if await users_coll.find_one({"username": user.username}):
-        raise HTTPException(status.HTTP_400_BAD_REQUEST,
-            detail={"error_code":"USERNAME_TAKEN","message":"Usuario ya en uso"})
-    hashed_pw = get_password_hash(user.password)
-    res = await users_coll.insert_one({
-        "email": user.email,
-        "username": user.username,
-        "name": user.name,
-        "hashed_password": hashed_pw
-    })
+    # Sin los índices únicos confirmados al arrancar, una consulta previa evita duplicados
+    if not indices_usuarios_confirmados():
+        existente = await users_coll.find_one(
+            {"$or": [{"email": user.email}, {"username": user.username}]},
+            {"email": 1}
+        )
+        if existente:
+            raise _error_duplicado("email" if existente.get("email") == user.email else "username")
+
+    hashed_pw = await get_password_hash_async(user.password)
+    # Los índices únicos de email y username detectan los duplicados en el mismo insert
+    try:
+        res = await users_coll.insert_one({
+            "email": user.email,
+            "username": user.username,
+            "name": user.name,
+            "hashed_password": hashed_pw
+        })
+    except DuplicateKeyError as e:
+        raise _error_duplicado(_campo_duplicado(e))
     return UserOut(id=str(res.inserted_id), email=user.email, username=user.username, name=user.name)
 
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    # Intentamos buscar por email primero
-    user = await users_coll.find_one({"email": form_data.username})
-    # Si no encontramos por email, intentamos por username
-    if not user:
-        user = await users_coll.find_one({"username": form_data.username})
+    # Buscamos por email o username en una sola consulta
+    user = await find_user_by_login(form_data.username)
     
     # Verificamos si el usuario existe y la contraseña es correcta
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    valido, nuevo_hash = (False, None)
+    if user:
+        valido, nuevo_hash = await verify_and_update_password(form_data.password, user["hashed_password"])
+    if not valido:
         raise HTTPException(status.HTTP_401_UNAUTHORIZED,
             detail={"error_code":"INVALID_CREDENTIALS","message":"Email o contraseña incorrectos"},
             headers={"WWW-Authenticate": "Bearer"})
+
+    # Rehash transparente si cambió el factor de trabajo
+    if nuevo_hash:
+        await users_coll.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": nuevo_hash}})
+        cache_sesiones.invalidar_usuario(user_id=str(user["_id"]))
     
-    # Generamos el token con el email del usuario
-    token = create_access_token(sub=user["email"])
+    # Generamos el token con el email del usuario; el jti es el id de la sesión
+    session_id = str(uuid.uuid4())
+    token = create_access_token(sub=user["email"], jti=session_id, user_id=str(user["_id"]))
     
     # Guardamos el token en la colección de sesiones
-    session_id = await save_token(str(user["_id"]), token)
+    await save_token(str(user["_id"]), token, session_id)
     
     return {"access_token": token, "token_type": "bearer", "session_id": session_id}
 
@@ -63,28 +95,28 @@ async def logout_all(current_user=Depends(get_current_user)):
 
 @router.put("/change-password")
 async def change_password(data: PasswordChange, current_user=Depends(get_current_user)):
-    if not verify_password(data.old_password, current_user["hashed_password"]):
+    if not await verify_password_async(data.old_password, current_user["hashed_password"]):
         raise HTTPException(status.HTTP_400_BAD_REQUEST,
             detail={"error_code":"INVALID_OLD_PASSWORD","message":"Contraseña antigua incorrecta"})
-    new_hashed = get_password_hash(data.new_password)
+    new_hashed = await get_password_hash_async(data.new_password)
     await users_coll.update_one(
         {"_id": ObjectId(current_user["_id"])},
         {"$set": {"hashed_password": new_hashed}}
     )
+    # Las sesiones cacheadas guardan el hash anterior
+    cache_sesiones.invalidar_usuario(user_id=str(current_user["_id"]))
     return {"message": "Contraseña actualizada correctamente"}
 
 @router.post("/request-password-reset")
 async def request_password_reset(request_data: RequestPasswordReset):
     """Solicitar un token para resetear la contraseña."""
-    user = await users_coll.find_one({"email": request_data.email})
+    reset_token = await create_password_reset_token(request_data.email)
     
-    if not user:
+    if not reset_token:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail={"error_code": "EMAIL_NOT_FOUND", "message": "Correo no encontrado"}
         )
-
-    reset_token = await create_password_reset_token(request_data.email)
     
     return {
         "message": "Correo encontrado!",
@@ -1,5 +1,7 @@
 # main interbank - Plin
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from login import router as auth_router
 from filtros.filtro_plin import router as plin_router
@@ -11,8 +13,42 @@ from filtros.filtro_claves import router as claves_router
 from filtros.filtro_logo import router as logo_router
 from filtros.filtro_ocr import router as ocr_router
 from filtros.filtro_validarplin import router as validarplin_router
+from filtros.filtro_analizar import router as analizar_router
+from filtros.filtro_lote import router as lote_router
+from filtros.filtro_cascada import router as cascada_router
+from filtros.filtro_pixeles import registro_pixeles
+from filtros.filtro_logo import precargar_perfiles_logo
+from filtros.cliente_ocr import servicio_ocr
+from filtros.ejecutor import ejecutor
+from filtros.metricas import router as metricas_router, MiddlewareMetricas, metricas
+from auth import cerrar_pool_hash, get_token_claims, ACCESS_TOKEN_EXPIRE_MINUTES, AUTH_MODO, AUTH_FILTROS
+from revocacion import lista_revocacion
+from bd import asegurar_indices, MONGO_INDICES_AL_INICIO
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Precarga de plantillas: sus características se calculan una sola vez
+    registro_pixeles.precargar()
+    precargar_perfiles_logo()
+    # Los índices se crean antes de atender peticiones: /register depende de
+    # los índices únicos de usuarios, así que un fallo detiene el arranque
+    if MONGO_INDICES_AL_INICIO:
+        await asegurar_indices(ttl_sesiones=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    tareas = []
+    if AUTH_MODO == "jwt":
+        tareas.append(asyncio.create_task(lista_revocacion.ejecutar_sincronizacion()))
+    yield
+    for tarea in tareas:
+        tarea.cancel()
+    await servicio_ocr.cerrar()
+    ejecutor.cerrar()
+    cerrar_pool_hash()
+
+app = FastAPI(lifespan=lifespan)
+
+# Tiempos por etapa: /metrics y cabecera Server-Timing
+app.add_middleware(MiddlewareMetricas)
+metricas.indicador("ejecutor_trabajos_pendientes", lambda: ejecutor.pendientes, "Trabajos admitidos en el ejecutor de filtros")
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,12 +59,19 @@ app.add_middleware(
 )
 
 app.include_router(auth_router)
-app.include_router(plin_router)
-app.include_router(pixeles_router)
-app.include_router(exif_router)
-app.include_router(ruido_router)
-app.include_router(histograma_router)
-app.include_router(claves_router)
-app.include_router(logo_router)
-app.include_router(ocr_router)
-app.include_router(validarplin_router)
\ No newline at end of file
+app.include_router(metricas_router)
+
+# Con AUTH_FILTROS los endpoints de imágenes exigen token (en modo "jwt" sin consultar Mongo)
+dependencias_filtros = [Depends(get_token_claims)] if AUTH_FILTROS else []
+app.include_router(plin_router, dependencies=dependencias_filtros)
+app.include_router(pixeles_router, dependencies=dependencias_filtros)
+app.include_router(exif_router, dependencies=dependencias_filtros)
+app.include_router(ruido_router, dependencies=dependencias_filtros)
+app.include_router(histograma_router, dependencies=dependencias_filtros)
+app.include_router(claves_router, dependencies=dependencias_filtros)
+app.include_router(logo_router, dependencies=dependencias_filtros)
+app.include_router(ocr_router, dependencies=dependencias_filtros)
+app.include_router(validarplin_router, dependencies=dependencias_filtros)
+app.include_router(analizar_router, dependencies=dependencias_filtros)
+app.include_router(lote_router, dependencies=dependencias_filtros)
+app.include_router(cascada_router, dependencies=dependencias_filtros)
\ No newline at end of file
@@ -0,0 +1,106 @@
+# Lista de revocación para el modo JWT sin estado
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from bd import revocations_coll
+
+load_dotenv()
+
+# Cada cuánto se traen de Mongo las revocaciones hechas por otros procesos
+AUTH_SYNC_SEGUNDOS = float(os.getenv("AUTH_SYNC_SEGUNDOS", "15"))
+# Solape entre sincronizaciones para no perder escrituras que llegan tarde
+AUTH_SYNC_SOLAPE = 5
+
+
+class ListaRevocacion:
+    """
+    Tokens revocados antes de su `exp`, en memoria:
+    - por jti (/logout): jti -> exp del token
+    - por usuario (/logout-all): user_id -> instante de revocación; se
+      rechaza todo token de ese usuario emitido antes (iat < revocado_en)
+
+    Las revocaciones locales se aplican al instante y se guardan en Mongo;
+    los demás procesos las reciben en la siguiente sincronización. Las
+    entradas desaparecen cuando los tokens afectados ya habrían caducado.
+    """
+
+    def __init__(self, coll=revocations_coll):
+        self.coll = coll
+        self._jtis: Dict[str, float] = {}
+        self._usuarios: Dict[str, tuple] = {}
+        self._ultimo_sync: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def esta_revocado(self, jti: str, user_id: Optional[str] = None, iat: Optional[float] = None) -> bool:
+        if jti in self._jtis:
+            return True
+        entrada = self._usuarios.get(user_id) if user_id else None
+        return entrada is not None and iat is not None and float(iat) < entrada[0]
+
+    def _aplicar(self, doc: Dict):
+        with self._lock:
+            if doc.get("jti"):
+                self._jtis[doc["jti"]] = doc["exp"]
+            elif doc.get("user_id"):
+                actual = self._usuarios.get(doc["user_id"])
+                if actual is None or doc["revocado_en"] > actual[0]:
+                    self._usuarios[doc["user_id"]] = (doc["revocado_en"], doc["exp"])
+
+    def purgar(self):
+        ahora = time.time()
+        with self._lock:
+            for jti in [j for j, exp in self._jtis.items() if exp < ahora]:
+                del self._jtis[jti]
+            for uid in [u for u, (_, exp) in self._usuarios.items() if exp < ahora]:
+                del self._usuarios[uid]
+
+    async def _guardar(self, doc: Dict):
+        self._aplicar(doc)
+        # `expira` alimenta el índice TTL; `exp` (epoch) evita conversiones de zona horaria
+        await self.coll.insert_one({
+            **doc,
+            "expira": datetime.utcfromtimestamp(doc["exp"]),
+            "creado": datetime.utcnow()
+        })
+
+    async def revocar_token(self, jti: str, exp: float):
+        await self._guardar({"jti": jti, "exp": float(exp)})
+
+    async def revocar_usuario(self, user_id: str, vigencia_tokens: int):
+        ahora = time.time()
+        await self._guardar({
+            "user_id": user_id,
+            "revocado_en": ahora,
+            "exp": ahora + vigencia_tokens
+        })
+
+    async def sincronizar(self):
+        """Trae las revocaciones nuevas (o todas las vigentes la primera vez)"""
+        inicio = datetime.utcnow()
+        if self._ultimo_sync is None:
+            filtro = {"expira": {"$gt": inicio}}
+        else:
+            filtro = {"creado": {"$gt": self._ultimo_sync}}
+        async for doc in self.coll.find(filtro):
+            self._aplicar(doc)
+        self._ultimo_sync = inicio - timedelta(seconds=AUTH_SYNC_SOLAPE)
+        self.purgar()
+
+    async def ejecutar_sincronizacion(self, intervalo: float = AUTH_SYNC_SEGUNDOS):
+        while True:
+            try:
+                await self.sincronizar()
+            except Exception as e:
+                print(f"⚠️  Error sincronizando la lista de revocación: {e}")
+            await asyncio.sleep(intervalo)
+
+    def __len__(self):
+        return len(self._jtis) + len(self._usuarios)
+
+
+lista_revocacion = ListaRevocacion()